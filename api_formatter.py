@@ -90,3 +90,38 @@ def format_submit_result_to_card(data: Dict[str, Any]) -> Dict[str, Any]:
         "desc": f"调班申请结果：{result_status} - {message_text}",
     }
 
+
+def format_calendar_result_to_card(data: Dict[str, Any]) -> Dict[str, Any]:
+    """将 query_availability_calendar 的结果转换为卡片格式"""
+    days = data.get("days", [])
+    totals = data.get("totals", {})
+    open_days = [d for d in days if d.get("remaining", 0) > 0]
+
+    days_table = ""
+    if days:
+        days_table = "| 日期 | 档期数 | 总容量 | 已约 | 剩余名额 |\n"
+        days_table += "|------|--------|--------|------|----------|\n"
+        for day in days:
+            days_table += f"| {day.get('date', '')} | {day.get('slots', 0)} | {day.get('capacity', 0)} | {day.get('booked', 0)} | {day.get('remaining', 0)} |\n"
+
+    markdown_content = f"""## 可约日历
+
+**课程**: {data.get('course_name', '')}
+**日期范围**: {data.get('start_date', '')} ~ {data.get('end_date', '')}
+**有名额的天数**: {len(open_days)} / {len(days)}
+
+{days_table if days_table else "该范围内暂无档期"}
+
+**合计**: 档期 {totals.get('slots', 0)} 个，总容量 {totals.get('capacity', 0)}，已约 {totals.get('booked', 0)}，剩余 {totals.get('remaining', 0)}
+"""
+
+    return {
+        "type": "markdown",
+        "data": [markdown_content],
+        "raw": [data],
+        "markdown": markdown_content,
+        "field_headers": ["date", "slots", "capacity", "booked", "remaining"],
+        "chart_type": "",
+        "dimension": "",
+        "desc": f"可约日历：{data.get('course_name', '')} {data.get('start_date', '')} ~ {data.get('end_date', '')} 共 {len(open_days)} 天有剩余名额，剩余 {totals.get('remaining', 0)} 个",
+    }
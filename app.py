@@ -1,15 +1,38 @@
+import hmac
+import io
+import os
+import tempfile
 from contextlib import asynccontextmanager
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 from fastapi import FastAPI, Request, Body
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from mcp_server import mcp, query_available_slots_impl, submit_schedule_change_impl
-from api_formatter import format_query_result_to_card, format_submit_result_to_card
+from api_formatter import (
+    format_query_result_to_card,
+    format_submit_result_to_card,
+    format_calendar_result_to_card,
+)
+from availability import query_availability_calendar
+from bulk_io import DEFAULT_CHECKPOINT_EVERY, DEFAULT_CHUNK_SIZE, import_records, export_records, run_in_worker
+from serialization import dumps, dumps_str
+from storage import check_layout
+
+
+class FastJSONResponse(JSONResponse):
+    """使用 serialization 层（优先 orjson）编码的 JSON 响应"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
 
 mcp_app = mcp.http_app()
 
 # 2️⃣ 合并 lifespan（这是解决 500 / task group 的关键）
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # 分片方式与数据目录不一致时拒绝启动（见 README 第 13 节）
+    check_layout()
     async with mcp_app.lifespan(app):
         yield
 
@@ -18,6 +41,7 @@ app = FastAPI(
     title="Schedule Shift MCP Server",
     description="教育-临时调班 MCP Server",
     lifespan=lifespan,
+    default_response_class=FastJSONResponse,
 )
 
 # 4️⃣ MCP 只挂载到 /mcp（千万不要是 /）
@@ -27,7 +51,7 @@ app.mount("/mcp", mcp_app)
 @app.get("/health")
 async def health_check():
     """健康检查端点"""
-    return JSONResponse({"status": "OK"})
+    return FastJSONResponse({"status": "OK"})
 
 
 # 注意：FastAPI 自动生成的文档端点：
@@ -56,9 +80,9 @@ async def health_check():
         
 #         # 转换为卡片格式
 #         card_response = format_query_result_to_card(result)
-#         return JSONResponse(card_response)
+#         return FastJSONResponse(card_response)
 #     except Exception as e:
-#         return JSONResponse({
+#         return FastJSONResponse({
 #             "type": "markdown",
 #             "data": [f"错误: {str(e)}"],
 #             "raw": [{"error": str(e)}],
@@ -78,17 +102,18 @@ async def api_submit_schedule_change(request: Request):
     try:
         body: Dict[str, Any] = await request.json()
         
-        # 调用普通函数
-        result = submit_schedule_change_impl(
+        # 调用普通函数；读写存储是阻塞 I/O，放到线程池执行，不阻塞事件循环
+        result = await run_in_threadpool(
+            submit_schedule_change_impl,
             student_name=body.get("student_name", ""),
             target_date=body.get("target_date", ""),
         )
         
         # 转换为卡片格式
         card_response = format_submit_result_to_card(result)
-        return JSONResponse(card_response)
+        return FastJSONResponse(card_response)
     except Exception as e:
-        return JSONResponse({
+        return FastJSONResponse({
             "type": "markdown",
             "data": [f"错误: {str(e)}"],
             "raw": [{"error": str(e)}],
@@ -100,8 +125,9 @@ async def api_submit_schedule_change(request: Request):
         }, status_code=400)
 
 
+# 普通 def：FastAPI 在线程池中执行，读取存储与重建日历索引不阻塞事件循环
 @app.get("/api/query-available-slots")
-async def api_query_available_slots_get(
+def api_query_available_slots_get(
     course_name: str,
     original_date: str,
     target_date: str,
@@ -117,9 +143,9 @@ async def api_query_available_slots_get(
         )
         
         card_response = format_query_result_to_card(result)
-        return JSONResponse(card_response)
+        return FastJSONResponse(card_response)
     except Exception as e:
-        return JSONResponse({
+        return FastJSONResponse({
             "type": "markdown",
             "data": [f"错误: {str(e)}"],
             "raw": [{"error": str(e)}],
@@ -131,6 +157,139 @@ async def api_query_available_slots_get(
         }, status_code=400)
 
 
+@app.get("/api/availability-calendar")
+def api_availability_calendar(
+    course_name: str,
+    start_date: str,
+    end_date: str,
+):
+    """
+    可约日历（GET，按课程 + 日期范围返回每天的容量汇总）
+    """
+    try:
+        result = query_availability_calendar(
+            course_name=course_name,
+            start_date=start_date,
+            end_date=end_date,
+        )
+
+        card_response = format_calendar_result_to_card(result)
+        return FastJSONResponse(card_response)
+    except Exception as e:
+        return FastJSONResponse({
+            "type": "markdown",
+            "data": [f"错误: {str(e)}"],
+            "raw": [{"error": str(e)}],
+            "markdown": f"**错误**: {str(e)}",
+            "field_headers": [],
+            "chart_type": "",
+            "dimension": "",
+            "desc": f"查询可约日历时发生错误: {str(e)}",
+        }, status_code=400)
+
+
+# ========== 管理端点：批量导入/导出 ==========
+
+# 管理端点的访问令牌：请求需带 Authorization: Bearer <令牌>；未设置时管理端点整体关闭
+ADMIN_TOKEN = os.getenv("SCHEDULE_ADMIN_TOKEN", "")
+
+
+def _admin_denied(request: Request) -> Optional[FastJSONResponse]:
+    """校验管理令牌，通过时返回 None，否则返回 401/403 错误卡片"""
+    if not ADMIN_TOKEN:
+        status_code, message = 403, "管理端点未启用（未设置 SCHEDULE_ADMIN_TOKEN）"
+    else:
+        scheme, _, token = request.headers.get("authorization", "").partition(" ")
+        if scheme.lower() == "bearer" and hmac.compare_digest(token.strip().encode(), ADMIN_TOKEN.encode()):
+            return None
+        status_code, message = 401, "管理令牌无效"
+    return FastJSONResponse({
+        "type": "markdown",
+        "data": [f"错误: {message}"],
+        "raw": [{"error": message}],
+        "markdown": f"**错误**: {message}",
+        "field_headers": [],
+        "chart_type": "",
+        "dimension": "",
+        "desc": message,
+    }, status_code=status_code)
+
+
+@app.post("/api/admin/import")
+async def api_admin_import(
+    request: Request,
+    kind: str,
+    format: str = "jsonl",
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    checkpoint_every: int = DEFAULT_CHECKPOINT_EVERY,
+):
+    """
+    批量导入 courses/slots（请求体为 CSV 或 JSONL），按主键分块 upsert，
+    以 NDJSON 逐块返回进度，最后一行为汇总
+    """
+    denied = _admin_denied(request)
+    if denied is not None:
+        return denied
+
+    # 请求体先落到临时文件，内存占用与上传大小无关
+    spool = tempfile.TemporaryFile()
+    try:
+        async for piece in request.stream():
+            spool.write(piece)
+        spool.seek(0)
+        text = io.TextIOWrapper(spool, encoding="utf-8-sig", newline="")
+        events = import_records(text, kind, format, chunk_size, checkpoint_every)
+    except Exception as e:
+        spool.close()
+        return FastJSONResponse({
+            "type": "markdown",
+            "data": [f"错误: {str(e)}"],
+            "raw": [{"error": str(e)}],
+            "markdown": f"**错误**: {str(e)}",
+            "field_headers": [],
+            "chart_type": "",
+            "dimension": "",
+            "desc": f"批量导入时发生错误: {str(e)}",
+        }, status_code=400)
+
+    def ndjson():
+        for event in run_in_worker(events, on_finish=text.close):
+            yield dumps_str(event) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+@app.get("/api/admin/export")
+async def api_admin_export(request: Request, kind: str, format: str = "jsonl"):
+    """
+    流式导出 courses/slots 为 CSV 或 JSONL
+    """
+    denied = _admin_denied(request)
+    if denied is not None:
+        return denied
+
+    try:
+        pieces = export_records(kind, format)
+    except Exception as e:
+        return FastJSONResponse({
+            "type": "markdown",
+            "data": [f"错误: {str(e)}"],
+            "raw": [{"error": str(e)}],
+            "markdown": f"**错误**: {str(e)}",
+            "field_headers": [],
+            "chart_type": "",
+            "dimension": "",
+            "desc": f"批量导出时发生错误: {str(e)}",
+        }, status_code=400)
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        pieces,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{kind}.{format}"'},
+    )
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
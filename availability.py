@@ -0,0 +1,242 @@
+"""按课程、按天聚合的档期容量索引（可约日历）
+
+每门课程（slot.content）维护一段连续的“天”坐标，记录每天的档期数 / 容量 / 已约，
+并用树状数组（Fenwick）维护前缀和：单日读取是一次数组访问，区间合计是两次前缀查询。
+索引按存储分片分区（非分片模式下只有 db.json 一个分区），档期通过 storage 的
+upsert 变更时按差量增量更新；分片文件被外部改写时只重建该分区。
+"""
+
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import storage
+
+# 一次日历查询最多覆盖的天数
+MAX_RANGE_DAYS = 366
+# 档期日期的合理窗口：窗口外的档期导入时拒绝，手工写入的不计入日历
+MIN_SLOT_DATE = date(2000, 1, 1)
+MAX_SLOT_DATE = date(2099, 12, 31)
+# 坐标扩展的最小步长；扩展按当前长度成倍增长，重建树的总代价与天数成线性
+_GROW_PADDING_DAYS = 31
+
+_METRICS = ("slots", "capacity", "booked")
+
+
+class _Fenwick:
+    """树状数组：O(log n) 单点加、O(log n) 前缀和"""
+
+    __slots__ = ("tree",)
+
+    def __init__(self, values: List[int]):
+        tree = [0] + list(values)
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self.tree = tree
+
+    def add(self, index: int, delta: int) -> None:
+        i = index + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix(self, end: int) -> int:
+        """[0, end) 的和"""
+        total = 0
+        i = end
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+
+class _CourseCalendar:
+    """单门课程的按天桶：origin 起连续若干天，每个指标一份逐日数组 + 一棵树状数组"""
+
+    def __init__(self, origin: date, length: int):
+        self.origin = origin
+        self.days: Dict[str, List[int]] = {m: [0] * length for m in _METRICS}
+        self.trees: Dict[str, _Fenwick] = {m: _Fenwick(self.days[m]) for m in _METRICS}
+
+    def __len__(self) -> int:
+        return len(self.days["slots"])
+
+    def _ensure(self, day: date) -> int:
+        """确保 day（须在日期窗口内）落在坐标范围内，必要时扩展并重建树，返回其下标"""
+        offset = (day - self.origin).days
+        if 0 <= offset < len(self):
+            return offset
+        grow = max(len(self), _GROW_PADDING_DAYS)
+        if offset < 0:
+            shift = max(-offset, min(grow, (self.origin - MIN_SLOT_DATE).days))
+            self.origin -= timedelta(days=shift)
+            for m in _METRICS:
+                self.days[m] = [0] * shift + self.days[m]
+            offset += shift
+        else:
+            room = (MAX_SLOT_DATE - self.origin).days + 1 - len(self)
+            extra = max(offset - len(self) + 1, min(grow, room))
+            for m in _METRICS:
+                self.days[m].extend([0] * extra)
+        self.trees = {m: _Fenwick(self.days[m]) for m in _METRICS}
+        return offset
+
+    def add(self, day: date, deltas: Tuple[int, int, int]) -> None:
+        offset = self._ensure(day)
+        for m, delta in zip(_METRICS, deltas):
+            if delta:
+                self.days[m][offset] += delta
+                self.trees[m].add(offset, delta)
+
+    def query(self, start: date, end: date) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+        """[start, end] 内有档期的逐日合计，以及区间总计"""
+        lo = max((start - self.origin).days, 0)
+        hi = min((end - self.origin).days + 1, len(self))
+        if lo >= hi:
+            return [], _totals(0, 0, 0)
+
+        slots, capacity, booked = self.days["slots"], self.days["capacity"], self.days["booked"]
+        days = [
+            {"date": (self.origin + timedelta(days=i)).isoformat(), **_totals(slots[i], capacity[i], booked[i])}
+            for i in range(lo, hi)
+            if slots[i]
+        ]
+        sums = [self.trees[m].prefix(hi) - self.trees[m].prefix(lo) for m in _METRICS]
+        return days, _totals(*sums)
+
+
+def _totals(slots: int, capacity: int, booked: int) -> Dict[str, int]:
+    return {
+        "slots": slots,
+        "capacity": capacity,
+        "booked": booked,
+        "remaining": capacity - booked,
+    }
+
+
+def _slot_bucket(slot: Dict[str, Any]) -> Optional[Tuple[str, date, Tuple[int, int, int]]]:
+    """
+    档期对应的 (课程, 日期, (1, capacity, booked))；time 无法解析或不在日期窗口内、
+    capacity/booked 不是整数（如手工编辑出错）时返回 None，该档期不计入日历
+    """
+    try:
+        day = date.fromisoformat(str(slot.get("time", ""))[:10])
+        capacity = int(slot.get("capacity", 0))
+        booked = int(slot.get("booked", 0))
+    except (TypeError, ValueError):
+        return None
+    if not MIN_SLOT_DATE <= day <= MAX_SLOT_DATE:
+        return None
+    return slot.get("content", ""), day, (1, capacity, booked)
+
+
+class _Partition:
+    """单个存储分片内各课程的按天桶；只在该分片锁内读写"""
+
+    def __init__(self) -> None:
+        self.courses: Dict[str, _CourseCalendar] = {}
+        self.built = False
+        self.signature: Optional[Tuple[int, int]] = None
+
+    def add(self, slot: Dict[str, Any], sign: int) -> None:
+        bucket = _slot_bucket(slot)
+        if bucket is None:
+            return
+        content, day, values = bucket
+        calendar = self.courses.get(content)
+        if calendar is None:
+            calendar = self.courses[content] = _CourseCalendar(day, 1)
+        calendar.add(day, tuple(sign * v for v in values))
+
+    def rebuild(self, key: str) -> None:
+        self.courses = {}
+        for slot in storage.get_shard_slots(key):
+            self.add(slot, 1)
+        self.signature = storage.shard_signature(key)
+        self.built = True
+
+
+class AvailabilityIndex:
+    """按存储分片划分的按天桶；每个分区只在 storage.shard_lock(分片) 内读写"""
+
+    def __init__(self) -> None:
+        self._partitions: Dict[str, _Partition] = {}
+
+    def on_slot_changes(
+        self,
+        key: str,
+        changes: storage.SlotChanges,
+        before: Optional[Tuple[int, int]],
+    ) -> None:
+        """storage 写入分片后的回调：只对变化的档期做差量更新"""
+        partition = self._partitions.get(key)
+        if partition is None or not partition.built:
+            # 尚未建立，留到第一次查询时整体构建
+            return
+        if partition.signature != before:
+            # 写入前分片文件已被外部改写：留到下次查询时整体重建
+            partition.built = False
+            return
+        for old, new in changes:
+            if old is not None:
+                partition.add(old, -1)
+            if new is not None:
+                partition.add(new, 1)
+        partition.signature = storage.shard_signature(key)
+
+    def calendar(self, content: str, start: date, end: date) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+        results = []
+        for key in storage.slot_shard_keys(content):
+            with storage.shard_lock(key):
+                partition = self._partitions.setdefault(key, _Partition())
+                if not partition.built or partition.signature != storage.shard_signature(key):
+                    partition.rebuild(key)
+                calendar = partition.courses.get(content)
+                if calendar is not None:
+                    results.append(calendar.query(start, end))
+
+        if not results:
+            return [], _totals(0, 0, 0)
+        if len(results) == 1:
+            return results[0]
+
+        # 按校区分片时同一课程分布在多个分片，逐日合并
+        merged: Dict[str, List[int]] = {}
+        for days, _ in results:
+            for day in days:
+                acc = merged.setdefault(day["date"], [0, 0, 0])
+                for i, m in enumerate(_METRICS):
+                    acc[i] += day[m]
+        sums = [sum(totals[m] for _, totals in results) for m in _METRICS]
+        return [{"date": d, **_totals(*merged[d])} for d in sorted(merged)], _totals(*sums)
+
+
+_INDEX = AvailabilityIndex()
+storage.add_slot_listener(_INDEX.on_slot_changes)
+
+
+def query_availability_calendar(course_name: str, start_date: str, end_date: str) -> Dict[str, Any]:
+    """
+    按课程名称查询 [start_date, end_date] 内每天的档期数、容量、已约与剩余名额。
+    只返回有档期的日期；日期格式 YYYY-MM-DD。
+    """
+    try:
+        start = date.fromisoformat(start_date)
+        end = date.fromisoformat(end_date)
+    except ValueError:
+        raise ValueError("日期格式应为 YYYY-MM-DD") from None
+    if end < start:
+        raise ValueError("end_date 不能早于 start_date")
+    if (end - start).days + 1 > MAX_RANGE_DAYS:
+        raise ValueError(f"查询范围不能超过 {MAX_RANGE_DAYS} 天")
+
+    days, totals = _INDEX.calendar(course_name, start, end)
+    return {
+        "status": "ok",
+        "course_name": course_name,
+        "start_date": start.isoformat(),
+        "end_date": end.isoformat(),
+        "days": days,
+        "totals": totals,
+    }
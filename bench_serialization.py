@@ -0,0 +1,118 @@
+"""序列化基准：对比标准库 json 与 serialization 层在大 db 上的读写耗时
+
+用法：
+    python bench_serialization.py --slots 200000 --requests 50000
+"""
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import serialization
+
+CONTENTS = ["初中数学", "初中英语", "高中数学", "高中英语", "高中物理", "初中语文", "高中化学", "初中物理"]
+TEACHERS = ["李老师", "王老师", "张老师", "陈老师", "刘老师"]
+
+
+def generate_db(n_slots: int, n_requests: int) -> Dict[str, Any]:
+    """生成与 data/db.json 结构一致的大 db"""
+    courses = [
+        {
+            "course_key": f"COURSE_{i:06d}",
+            "student_name": f"学生{i}",
+            "phone_last4": f"{i % 10000:04d}",
+            "content": CONTENTS[i % len(CONTENTS)],
+            "teacher": TEACHERS[i % len(TEACHERS)],
+        }
+        for i in range(max(n_slots // 100, 1))
+    ]
+    slots = [
+        {
+            "slot_id": f"SLOT_{i:08d}",
+            "time": f"2026-{i % 12 + 1:02d}-{i % 28 + 1:02d} {i % 12 + 8:02d}:00",
+            "teacher": TEACHERS[i % len(TEACHERS)],
+            "content": CONTENTS[i % len(CONTENTS)],
+            "capacity": 8,
+            "booked": i % 9,
+            "location": f"教学楼 A-{i % 500:03d}",
+        }
+        for i in range(n_slots)
+    ]
+    requests = [
+        {
+            "student_name": f"学生{i}",
+            "slot_id": f"SLOT_{i:08d}",
+            "status": "PENDING_AUDIT",
+            "timestamp": "2026-01-01T10:00:00.000000",
+        }
+        for i in range(n_requests)
+    ]
+    return {"courses": courses, "slots": slots, "requests": requests}
+
+
+def _timeit(fn: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(n_slots: int, n_requests: int, repeat: int) -> List[str]:
+    db = generate_db(n_slots, n_requests)
+    card = {"type": "markdown", "raw": [{"alternatives": db["slots"][:3]}], "data": ["x" * 512]}
+    rows: List[str] = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "db.json"
+
+        def std_save() -> None:
+            with path.open("w", encoding="utf-8") as f:
+                json.dump(db, f, ensure_ascii=False, indent=2)
+
+        def std_load() -> None:
+            with path.open("r", encoding="utf-8") as f:
+                json.load(f)
+
+        def fast_save(pretty: bool) -> Callable[[], None]:
+            return lambda: path.write_bytes(serialization.dumps(db, pretty=pretty))
+
+        def fast_load() -> None:
+            serialization.loads(path.read_bytes())
+
+        cases = [
+            ("stdlib json   indent=2", std_save, std_load),
+            (f"{serialization.BACKEND:<13} indent=2", fast_save(True), fast_load),
+            (f"{serialization.BACKEND:<13} compact", fast_save(False), fast_load),
+        ]
+        rows.append(f"backend={serialization.BACKEND} slots={n_slots} requests={n_requests} (best of {repeat})")
+        rows.append(f"{'case':<24} {'save(s)':>9} {'load(s)':>9} {'size(MB)':>9}")
+        for name, save, load in cases:
+            save_s = _timeit(save, repeat)
+            size_mb = path.stat().st_size / 1024 / 1024
+            load_s = _timeit(load, repeat)
+            rows.append(f"{name:<24} {save_s:>9.3f} {load_s:>9.3f} {size_mb:>9.1f}")
+
+    card_std = _timeit(lambda: [json.dumps(card, ensure_ascii=False).encode("utf-8") for _ in range(10000)], repeat)
+    card_fast = _timeit(lambda: [serialization.dumps(card) for _ in range(10000)], repeat)
+    rows.append(f"{'card x10000 stdlib':<24} {card_std:>9.3f}")
+    rows.append(f"{'card x10000 ' + serialization.BACKEND:<24} {card_fast:>9.3f}")
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="对比 JSON 序列化后端在大 db 上的读写耗时")
+    parser.add_argument("--slots", type=int, default=200000)
+    parser.add_argument("--requests", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    for row in run(args.slots, args.requests, args.repeat):
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,432 @@
+"""教务系统批量导入/导出：以 CSV / JSONL 流式分块读写 courses 与 slots
+
+命令行用法：
+    python bulk_io.py import slots term_slots.csv --chunk-size 5000
+    python bulk_io.py export slots -o term_slots.jsonl
+"""
+
+import argparse
+import csv
+import io
+import queue
+import re
+import sys
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from availability import MAX_SLOT_DATE, MIN_SLOT_DATE
+from serialization import JSONDecodeError, dumps_str, loads
+from storage import bulk_session, checkpoint, get_courses, iter_slots, upsert_courses, upsert_slots
+
+TIME_FORMAT = "%Y-%m-%d %H:%M"
+# 与 TIME_FORMAT 等价但要求补零；比 strptime 快一个数量级，百万行导入时校验不再是瓶颈
+_TIME_RE = re.compile(r"(\d{4})-(\d{2})-(\d{2}) (\d{2}):(\d{2})")
+DEFAULT_CHUNK_SIZE = 5000
+# 每写入多少块落盘一次：两次落盘之间存储文件只加载一次，改动只在内存中累积
+DEFAULT_CHECKPOINT_EVERY = 20
+# 错误明细只保留前若干条，保证超大文件导入时内存不随错误行数增长
+MAX_REPORTED_ERRORS = 100
+
+FORMATS = ("jsonl", "csv")
+FIELDS: Dict[str, Tuple[str, ...]] = {
+    "courses": ("course_key", "student_name", "phone_last4", "content", "teacher"),
+    "slots": ("slot_id", "time", "teacher", "content", "capacity", "booked", "location"),
+}
+KEY_FIELDS = {"courses": "course_key", "slots": "slot_id"}
+# 新增记录时必须提供的字段；更新已有记录时只需主键，未提供的字段保留原值
+REQUIRED: Dict[str, Tuple[str, ...]] = {
+    "courses": ("student_name", "content", "teacher"),
+    "slots": ("time", "teacher", "content", "capacity"),
+}
+DEFAULTS: Dict[str, Dict[str, Any]] = {
+    "courses": {"phone_last4": ""},
+    "slots": {"booked": 0, "location": ""},
+}
+
+
+class BulkRecordError(ValueError):
+    """单条导入记录校验失败"""
+
+
+def _present(raw: Dict[str, Any], field: str) -> bool:
+    """字段是否出现在输入中；CSV 的空单元格视为未提供"""
+    value = raw.get(field)
+    return value is not None and value != ""
+
+
+def _require_str(raw: Dict[str, Any], field: str) -> str:
+    value = raw.get(field)
+    if not isinstance(value, str) or not value.strip():
+        raise BulkRecordError(f"缺少字段 {field}")
+    return value.strip()
+
+
+def _optional_str(raw: Dict[str, Any], field: str) -> str:
+    value = raw.get(field)
+    if value is None:
+        return ""
+    if not isinstance(value, str):
+        raise BulkRecordError(f"字段 {field} 应为字符串")
+    return value.strip()
+
+
+def _require_int(raw: Dict[str, Any], field: str) -> int:
+    value = raw.get(field)
+    if value is None or value == "":
+        raise BulkRecordError(f"缺少字段 {field}")
+    # bool 是 int 的子类，JSONL 里的 true/false 不能当作数量
+    if isinstance(value, bool):
+        raise BulkRecordError(f"字段 {field} 应为整数: {value!r}")
+    if isinstance(value, int):
+        return value
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        raise BulkRecordError(f"字段 {field} 应为整数: {value!r}") from None
+
+
+def _pick(raw: Dict[str, Any], key_field: str, parsers: Dict[str, Callable[[Dict[str, Any], str], Any]]) -> Dict[str, Any]:
+    """只解析输入中出现的字段：更新已有记录时，未提供的字段保留原值"""
+    record = {key_field: _require_str(raw, key_field)}
+    for field, parse in parsers.items():
+        if _present(raw, field):
+            record[field] = parse(raw, field)
+    return record
+
+
+def _complete(
+    kind: str,
+    old: Optional[Dict[str, Any]],
+    record: Dict[str, Any],
+) -> Dict[str, Any]:
+    """新增时检查必填字段并补默认值，更新时与已存储记录合并"""
+    if old is not None:
+        return {**old, **record}
+    missing = [f for f in REQUIRED[kind] if f not in record]
+    if missing:
+        raise BulkRecordError(f"新增记录缺少字段 {', '.join(missing)}")
+    return {f: record.get(f, DEFAULTS[kind].get(f)) for f in FIELDS[kind]}
+
+
+def validate_course(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """校验一条课程记录中出现的字段"""
+    return _pick(raw, "course_key", {
+        "student_name": _require_str,
+        "phone_last4": _optional_str,
+        "content": _require_str,
+        "teacher": _require_str,
+    })
+
+
+def _parse_time(raw: Dict[str, Any], field: str) -> str:
+    time_str = _require_str(raw, field)
+    match = _TIME_RE.fullmatch(time_str)
+    try:
+        if match is None:
+            raise ValueError
+        day = datetime(*map(int, match.groups())).date()
+    except ValueError:
+        raise BulkRecordError(f"time 格式应为 YYYY-MM-DD HH:mm: {time_str!r}") from None
+    if not MIN_SLOT_DATE <= day <= MAX_SLOT_DATE:
+        raise BulkRecordError(f"time 超出 {MIN_SLOT_DATE.year}-{MAX_SLOT_DATE.year} 年范围: {time_str!r}")
+    return time_str
+
+
+def _parse_count(raw: Dict[str, Any], field: str) -> int:
+    value = _require_int(raw, field)
+    if value < 0:
+        raise BulkRecordError(f"{field} 不能为负数: {value}")
+    return value
+
+
+def validate_slot(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """校验一条档期记录中出现的字段：time 格式与年份范围、capacity/booked 非负"""
+    return _pick(raw, "slot_id", {
+        "time": _parse_time,
+        "teacher": _require_str,
+        "content": _require_str,
+        "capacity": _parse_count,
+        "booked": _parse_count,
+        "location": _optional_str,
+    })
+
+
+def merge_course(old: Optional[Dict[str, Any]], record: Dict[str, Any]) -> Dict[str, Any]:
+    """课程 upsert 的合并函数"""
+    return _complete("courses", old, record)
+
+
+def merge_slot(old: Optional[Dict[str, Any]], record: Dict[str, Any]) -> Dict[str, Any]:
+    """档期 upsert 的合并函数：在合并后的记录上检查 booked <= capacity"""
+    merged = _complete("slots", old, record)
+    capacity = _require_int(merged, "capacity")
+    booked = _require_int(merged, "booked")
+    if booked > capacity:
+        raise BulkRecordError(f"booked ({booked}) 超过 capacity ({capacity})")
+    return merged
+
+
+_VALIDATORS: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+    "courses": validate_course,
+    "slots": validate_slot,
+}
+_MERGES: Dict[str, Callable[[Optional[Dict[str, Any]], Dict[str, Any]], Dict[str, Any]]] = {
+    "courses": merge_course,
+    "slots": merge_slot,
+}
+_UPSERTS = {
+    "courses": upsert_courses,
+    "slots": upsert_slots,
+}
+_READERS: Dict[str, Callable[[], Iterable[Dict[str, Any]]]] = {
+    "courses": get_courses,
+    "slots": iter_slots,
+}
+
+
+def _check_kind_and_format(kind: str, fmt: str) -> None:
+    if kind not in FIELDS:
+        raise ValueError(f"不支持的数据类型: {kind}（可选 {', '.join(FIELDS)}）")
+    if fmt not in FORMATS:
+        raise ValueError(f"不支持的文件格式: {fmt}（可选 {', '.join(FORMATS)}）")
+
+
+def _iter_raw(stream: TextIO, fmt: str) -> Iterator[Tuple[int, Any]]:
+    """逐行产出 (行号, 原始记录)，JSONL 的解析推迟到校验阶段以便单行报错"""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_no, line in enumerate(stream, start=1):
+        if line.strip():
+            yield line_no, line
+
+
+def _decode(raw: Any) -> Dict[str, Any]:
+    if isinstance(raw, dict):
+        return raw
+    try:
+        record = loads(raw)
+    except JSONDecodeError as e:
+        raise BulkRecordError(f"JSON 解析失败: {e.msg}") from None
+    if not isinstance(record, dict):
+        raise BulkRecordError("每行应为一个 JSON 对象")
+    return record
+
+
+def import_records(
+    stream: TextIO,
+    kind: str,
+    fmt: str = "jsonl",
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    checkpoint_every: int = DEFAULT_CHECKPOINT_EVERY,
+) -> Iterator[Dict[str, Any]]:
+    """
+    流式导入 courses/slots：逐行校验，每满 chunk_size 条按主键 upsert 一次，
+    每 checkpoint_every 块落盘一次（progress 事件中的 saved 为已落盘的块数）。
+    结束时产出 done 事件（含汇总与错误明细）。
+
+    输入按行读取，内存与文件大小无关；但存储仍是整文件 JSON：两次落盘之间会把
+    涉及的 db.json（或分片文件）整体加载在内存中。必须在同一线程内迭代。
+    """
+    _check_kind_and_format(kind, fmt)
+    if chunk_size <= 0:
+        raise ValueError("chunk_size 必须为正整数")
+    if checkpoint_every <= 0:
+        raise ValueError("checkpoint_every 必须为正整数")
+    return _import_records(stream, kind, fmt, chunk_size, checkpoint_every)
+
+
+def _import_records(
+    stream: TextIO,
+    kind: str,
+    fmt: str,
+    chunk_size: int,
+    checkpoint_every: int,
+) -> Iterator[Dict[str, Any]]:
+    validate = _VALIDATORS[kind]
+    merge = _MERGES[kind]
+    upsert = _UPSERTS[kind]
+    key_field = KEY_FIELDS[kind]
+    summary: Dict[str, Any] = {
+        "kind": kind,
+        "chunks": 0,
+        "processed": 0,
+        "inserted": 0,
+        "updated": 0,
+        "invalid": 0,
+        "saved": 0,
+    }
+    errors: List[Dict[str, Any]] = []
+    chunk: List[Dict[str, Any]] = []
+    # 主键 → 本块内最后出现的行号，用于回报合并阶段被拒绝的记录
+    lines: Dict[str, int] = {}
+
+    def reject(line_no: int, error: str) -> None:
+        summary["invalid"] += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"line": line_no, "error": error})
+
+    def flush() -> Dict[str, Any]:
+        inserted, updated, rejected = upsert(chunk, merge)
+        for key, error in rejected:
+            reject(lines.get(key, 0), error)
+        chunk.clear()
+        lines.clear()
+        summary["chunks"] += 1
+        summary["inserted"] += inserted
+        summary["updated"] += updated
+        if summary["chunks"] % checkpoint_every == 0:
+            checkpoint()
+            summary["saved"] = summary["chunks"]
+        return {"event": "progress", **summary}
+
+    with bulk_session():
+        for line_no, raw in _iter_raw(stream, fmt):
+            summary["processed"] += 1
+            try:
+                record = validate(_decode(raw))
+            except BulkRecordError as e:
+                reject(line_no, str(e))
+                continue
+            chunk.append(record)
+            lines[record[key_field]] = line_no
+            if len(chunk) >= chunk_size:
+                yield flush()
+
+        if chunk:
+            yield flush()
+    summary["saved"] = summary["chunks"]
+    yield {"event": "done", **summary, "errors": errors}
+
+
+def run_in_worker(events: Iterator[Dict[str, Any]], on_finish: Optional[Callable[[], None]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    在独立线程中完整驱动一次导入并逐条转交事件。
+    导入依赖绑定线程的 bulk_session，而 StreamingResponse 可能在不同线程中取下一个元素；
+    调用方中途放弃迭代时导入仍会执行完并落盘。
+    """
+    pending: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+
+    def worker() -> None:
+        try:
+            for event in events:
+                pending.put(event)
+        except Exception as e:
+            pending.put({"event": "error", "error": str(e)})
+        finally:
+            if on_finish is not None:
+                on_finish()
+            pending.put(None)
+
+    threading.Thread(target=worker, name="bulk-import", daemon=True).start()
+    while True:
+        event = pending.get()
+        if event is None:
+            return
+        yield event
+
+
+def export_records(kind: str, fmt: str = "jsonl", chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[str]:
+    """流式导出 courses/slots，每 chunk_size 条记录产出一段文本"""
+    _check_kind_and_format(kind, fmt)
+    if chunk_size <= 0:
+        raise ValueError("chunk_size 必须为正整数")
+    return _export_records(kind, fmt, chunk_size)
+
+
+def _export_records(kind: str, fmt: str, chunk_size: int) -> Iterator[str]:
+    fields = FIELDS[kind]
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction="ignore", lineterminator="\n")
+    if fmt == "csv":
+        writer.writeheader()
+
+    pending = 0
+    for record in _READERS[kind]():
+        if fmt == "csv":
+            writer.writerow(record)
+        else:
+            buffer.write(dumps_str({f: record.get(f) for f in fields}))
+            buffer.write("\n")
+        pending += 1
+        if pending >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+
+    tail = buffer.getvalue()
+    if tail:
+        yield tail
+
+
+def _infer_format(path: Optional[str], fmt: Optional[str]) -> str:
+    if fmt:
+        return fmt
+    if path and Path(path).suffix.lower() == ".csv":
+        return "csv"
+    return "jsonl"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="批量导入/导出课程与档期（CSV / JSONL）",
+        epilog="注意：导入时存储文件整体加载在内存中（单文件模式为整个 db.json，"
+        "分片模式为涉及的分片），大批量导入建议启用 SCHEDULE_SHARD_BY。",
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_import = sub.add_parser("import", help="从 CSV/JSONL 文件导入（按主键 upsert）")
+    p_import.add_argument("kind", choices=list(FIELDS))
+    p_import.add_argument("path", help="输入文件路径，- 表示标准输入")
+    p_import.add_argument("--format", choices=FORMATS, help="默认按扩展名推断")
+    p_import.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    p_import.add_argument("--checkpoint-every", type=int, default=DEFAULT_CHECKPOINT_EVERY,
+                          help="每写入多少块落盘一次；两次落盘之间改动只在内存中")
+
+    p_export = sub.add_parser("export", help="导出为 CSV/JSONL 文件")
+    p_export.add_argument("kind", choices=list(FIELDS))
+    p_export.add_argument("-o", "--output", help="输出文件路径，默认标准输出")
+    p_export.add_argument("--format", choices=FORMATS, help="默认按扩展名推断")
+    p_export.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "import":
+        fmt = _infer_format(args.path, args.format)
+        stream = sys.stdin if args.path == "-" else open(args.path, "r", encoding="utf-8-sig", newline="")
+        try:
+            for event in import_records(stream, args.kind, fmt, args.chunk_size, args.checkpoint_every):
+                if event["event"] == "progress":
+                    print(
+                        f"[chunk {event['chunks']}] 已处理 {event['processed']} 条，"
+                        f"新增 {event['inserted']}，更新 {event['updated']}，无效 {event['invalid']}，"
+                        f"已落盘 {event['saved']} 块",
+                        file=sys.stderr,
+                    )
+                else:
+                    for err in event["errors"]:
+                        print(f"  第 {err['line']} 行: {err['error']}", file=sys.stderr)
+                    print(dumps_str(event))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        return 0
+
+    fmt = _infer_format(args.output, args.format)
+    out = sys.stdout if not args.output else open(args.output, "w", encoding="utf-8", newline="")
+    try:
+        for piece in export_records(args.kind, fmt, args.chunk_size):
+            out.write(piece)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
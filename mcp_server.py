@@ -11,6 +11,7 @@ from storage import (
     get_courses,
     append_request,
 )
+from availability import query_availability_calendar as query_availability_calendar_impl
 
 mcp = FastMCP("ScheduleShiftMCP")
 
@@ -88,8 +89,9 @@ def query_available_slots_impl(
             "alternatives": [],
         }
 
+    # 按课程路由：分片模式下只读取该课程所在分片
     target_slots = [
-        s for s in get_slots()
+        s for s in get_slots(course_name)
         if s.get("content") == course_name and s.get("time", "").startswith(target_date)
     ]
     target_slot = target_slots[0] if target_slots else None
@@ -118,7 +120,7 @@ def query_available_slots_impl(
         }
 
     alternatives_source = [
-        s for s in get_slots()
+        s for s in get_slots(course_name)
         if s.get("content") == course_name
            and (s.get("capacity", 0) - s.get("booked", 0)) > 0
            and not s.get("time", "").startswith(target_date)
@@ -195,7 +197,7 @@ def submit_schedule_change_impl(
         }
 
     candidate_slots = [
-        s for s in get_slots()
+        s for s in get_slots(course.get("content"))
         if s.get("content") == course.get("content")
            and s.get("time", "").startswith(target_date)
            and (s.get("capacity", 0) - s.get("booked", 0)) > 0
@@ -237,7 +239,7 @@ def submit_schedule_change_impl(
         "status": result_status,
         "timestamp": datetime.now().isoformat(),
     }
-    append_request(request_record)
+    append_request(request_record, slot=target_slot)
 
     message_text = "申请已提交" if result_status == "PENDING_AUDIT" else "调班成功" if result_status == "SUCCESS" else "提交失败"
 
@@ -265,3 +267,16 @@ def submit_schedule_change(
     """
     return submit_schedule_change_impl(student_name, target_date)
 
+
+# MCP 工具版本，调用 availability 中的普通函数（从按天预聚合的容量索引读取）
+@mcp.tool()
+def query_availability_calendar(
+    course_name: Annotated[str, Field(description="课程名称，例如'初中数学'、'高中物理'等")],
+    start_date: Annotated[str, Field(description="起始日期（含），格式为 YYYY-MM-DD，例如'2026-02-01'")],
+    end_date: Annotated[str, Field(description="结束日期（含），格式为 YYYY-MM-DD，例如'2026-02-28'，最多 366 天")],
+) -> Dict[str, Any]:
+    """
+    可约日历：按课程名称返回日期范围内每天的档期数、总容量、已约与剩余名额。
+    适合一次回答“下个月哪些天还有名额”，无需逐日调用 query_available_slots。
+    """
+    return query_availability_calendar_impl(course_name, start_date, end_date)
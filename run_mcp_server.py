@@ -1,11 +1,15 @@
 """直接运行 FastMCP HTTP 服务器（独立模式）"""
 from mcp_server import mcp
+from storage import check_layout
 
 if __name__ == "__main__":
     # FastMCP 可以直接运行 HTTP 服务器
     # 使用 run() 方法启动服务器
     import uvicorn
-    
+
+    # 分片方式与数据目录不一致时拒绝启动
+    check_layout()
+
     # 获取 FastMCP 的 ASGI 应用
     app = mcp.http_app()
     
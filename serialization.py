@@ -0,0 +1,45 @@
+"""JSON 序列化层：安装了 orjson 时使用 orjson，否则回退到标准库 json
+
+统一输出 UTF-8 字节、不转义中文，供存储读写与 REST 响应共用。
+"""
+
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 取决于运行环境
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+# orjson.JSONDecodeError 是 json.JSONDecodeError 的子类，两种后端都可以用它捕获
+JSONDecodeError = json.JSONDecodeError
+
+# 与标准库一致：int / float / bool / None 作为字典键时转成字符串
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS if orjson is not None else 0
+
+
+def dumps(obj: Any, *, pretty: bool = False) -> bytes:
+    """序列化为 UTF-8 字节；pretty=True 时两空格缩进，否则紧凑输出"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=_ORJSON_OPTIONS | (orjson.OPT_INDENT_2 if pretty else 0))
+        except TypeError:
+            # orjson 不支持超出 64 位的整数等少数情况：交给标准库，真正无法序列化时仍抛 TypeError
+            pass
+    if pretty:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dumps_str(obj: Any, *, pretty: bool = False) -> str:
+    """同 dumps，返回 str（用于按行写出 JSONL 等文本场景）"""
+    return dumps(obj, pretty=pretty).decode("utf-8")
+
+
+def loads(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+    """反序列化 JSON 字节或字符串"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -1,38 +1,543 @@
-import json
+import argparse
+import os
+import sys
+import threading
+from contextlib import ExitStack, contextmanager
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from urllib.parse import unquote
+
+from serialization import dumps, loads
+
+try:
+    import fcntl
+except ImportError:  # Windows 无 fcntl：退化为仅进程内互斥
+    fcntl = None
 
 BASE_DIR = Path(__file__).resolve().parent
 DB_PATH = BASE_DIR / "data" / "db.json"
+SHARD_DIR = BASE_DIR / "data" / "shards"
+
+# SCHEDULE_DB_COMPACT=true 时 db.json 紧凑写出（体积更小、写入更快），默认保持两空格缩进便于手工查看
+DB_COMPACT = os.getenv("SCHEDULE_DB_COMPACT", "false").lower() == "true"
+
+# SCHEDULE_SHARD_BY=content|campus 时启用分片存储：
+# courses 与未关联档期的申请仍在 db.json，slots 及其申请按课程内容（content）
+# 或校区（location 第一段，如“教学楼”）拆到 data/shards/<分片>.json，每个分片一把锁
+SHARD_BY = os.getenv("SCHEDULE_SHARD_BY", "").lower()
+
+# 非分片模式下档期所在的“分片”，即 db.json 本身
+MAIN_SHARD = ""
+# 分片模式下 content / location 为空的档期
+DEFAULT_SHARD = "_default"
+
+
+# 档期变更回调，参数为 (分片键, [(旧记录或 None, 新记录或 None), ...], 写入前的 shard_signature())
+SlotChanges = List[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]]
+SlotListener = Callable[[str, SlotChanges, Optional[Tuple[int, int]]], None]
+_SLOT_LISTENERS: List[SlotListener] = []
 
 
 class StorageError(Exception):
     pass
 
 
+if SHARD_BY not in ("", "content", "campus"):
+    raise StorageError(f"SCHEDULE_SHARD_BY 只能为 content 或 campus，当前为 {SHARD_BY!r}")
+
+
+def _read_json(path: Path) -> Dict[str, Any]:
+    return loads(path.read_bytes())
+
+
+def _write_json(path: Path, data: Dict[str, Any]) -> None:
+    # 先写临时文件再替换，不持锁的跨分片读取不会读到半个文件
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(dumps(data, pretty=not DB_COMPACT))
+    os.replace(tmp, path)
+
+
+def _signature(path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class _FileLock:
+    """
+    可重入的读写锁：进程内用 RLock，跨进程在 <数据文件>.lock 上加 fcntl.flock，
+    服务进程与命令行导入（python bulk_io.py）同时写同一文件时也互斥。
+    锁文件路径在最外层加锁时才解析，跟随 DB_PATH / SHARD_DIR 的修改。
+    """
+
+    def __init__(self, path: Callable[[], Path]):
+        self._path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fd: Optional[int] = None
+
+    def acquire(self) -> bool:
+        self._lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                path = self._path()
+                path.parent.mkdir(parents=True, exist_ok=True)
+                fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                except BaseException:
+                    os.close(fd)
+                    raise
+                self._fd = fd
+            except BaseException:
+                self._lock.release()
+                raise
+        self._depth += 1
+        return True
+
+    def release(self) -> None:
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fd, self._fd = self._fd, None
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        self._lock.release()
+
+    def __enter__(self) -> "_FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.release()
+
+
+def _lock_path(key: str) -> Path:
+    path = _shard_path(key)
+    return path.with_name(path.name + ".lock")
+
+
+# 保护 db.json 的“读-改-写”，避免批量导入与提交申请互相覆盖（含跨进程）
+_DB_LOCK = _FileLock(lambda: _lock_path(MAIN_SHARD))
+_SHARD_LOCKS: Dict[str, _FileLock] = {}
+_SHARD_LOCKS_GUARD = threading.Lock()
+
+
 def _load_db() -> Dict[str, Any]:
-    if not DB_PATH.exists():
-        raise StorageError(f"db.json not found at {DB_PATH}")
-    with DB_PATH.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    return _load_shard(MAIN_SHARD)
 
 
 def _save_db(db: Dict[str, Any]) -> None:
-    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    with DB_PATH.open("w", encoding="utf-8") as f:
-        json.dump(db, f, ensure_ascii=False, indent=2)
+    _save_shard(MAIN_SHARD, db)
+
+
+# ========== 分片路由 ==========
+
+def shard_key_for_slot(slot: Dict[str, Any]) -> str:
+    """档期所属分片：按 content 或 location 第一段；非分片模式恒为 MAIN_SHARD"""
+    if not SHARD_BY:
+        return MAIN_SHARD
+    if SHARD_BY == "content":
+        value = str(slot.get("content") or "").strip()
+    else:
+        parts = str(slot.get("location") or "").split()
+        value = parts[0] if parts else ""
+    return value or DEFAULT_SHARD
+
+
+def _shard_path(key: str) -> Path:
+    if key == MAIN_SHARD:
+        return DB_PATH
+    # 保留中文等字母数字，其余字符按 UTF-8 百分号转义：文件名可逆，且不会越出分片目录
+    name = "".join(
+        ch if ch.isalnum() or ch in "-_." else "".join(f"%{b:02X}" for b in ch.encode("utf-8"))
+        for ch in key
+    )
+    return SHARD_DIR / f"{name}.json"
+
+
+def _list_shard_keys() -> List[str]:
+    return sorted(unquote(p.name[: -len(".json")]) for p in SHARD_DIR.glob("*.json"))
+
+
+def _read_shard_file(key: str) -> Dict[str, Any]:
+    path = _shard_path(key)
+    if not path.exists():
+        if key == MAIN_SHARD:
+            raise StorageError(f"db.json not found at {DB_PATH}")
+        return {"slots": [], "requests": []}
+    return _read_json(path)
+
+
+def _load_shard(key: str) -> Dict[str, Any]:
+    session = _current_session()
+    if session is None:
+        return _read_shard_file(key)
+    data = session.cache.get(key)
+    if data is None:
+        # 批量会话内首次访问：加锁并缓存，直到下一次 checkpoint 才释放
+        session.locks.enter_context(shard_lock(key))
+        data = session.cache[key] = _read_shard_file(key)
+    return data
+
+
+def _save_shard(key: str, data: Dict[str, Any]) -> None:
+    session = _current_session()
+    if session is not None and session.cache.get(key) is data:
+        session.dirty.add(key)
+        return
+    _write_json(_shard_path(key), data)
+
+
+# ========== 批量写会话 ==========
+
+class _BulkSession:
+    """批量写会话：缓存会话内加载过的文件并持有其锁，改动只在 checkpoint 时写盘"""
+
+    def __init__(self) -> None:
+        self.cache: Dict[str, Dict[str, Any]] = {}
+        self.dirty: Set[str] = set()
+        self.locks = ExitStack()
+        # (文件, 集合) → (列表, 主键 → 下标)；列表被整体替换时失效
+        self.indexes: Dict[Tuple[str, str], Tuple[List[Dict[str, Any]], Dict[Any, int]]] = {}
+        # 尚未落盘的档期变更：checkpoint 写盘后才通知监听方，中途放弃时直接丢弃
+        self.changes: Dict[str, SlotChanges] = {}
+
+
+_SESSION = threading.local()
+# 同一时刻只允许一个批量会话（含跨进程），避免两个会话各持有一部分分片锁而互相等待
+_BULK_LOCK = _FileLock(lambda: DB_PATH.with_name("bulk.lock"))
+
+
+def _current_session() -> Optional[_BulkSession]:
+    return getattr(_SESSION, "current", None)
+
+
+@contextmanager
+def bulk_session() -> Iterator[None]:
+    """
+    批量写会话（用于大批量导入）：会话内对同一文件的多次 upsert 只加载一次，
+    改动在 checkpoint() 或正常退出时写盘；异常退出时丢弃上次 checkpoint 之后的改动。
+    会话绑定当前线程，期间其他线程对已加载文件的写入会等待到下一次 checkpoint。
+    """
+    if _current_session() is not None:
+        yield
+        return
+    _sharded()
+    with _BULK_LOCK:
+        _SESSION.current = _BulkSession()
+        try:
+            yield
+            checkpoint()
+        finally:
+            session = _SESSION.current
+            _SESSION.current = None
+            # 异常退出：未落盘的文件恢复为磁盘上的内容，路由表中这些分片下次 locate 时重新读取
+            _ROUTER.forget(session.cache)
+            session.locks.close()
+
+
+def checkpoint() -> None:
+    """写出当前批量会话中改动过的文件，清空缓存并释放其锁；不在会话内时什么也不做"""
+    session = _current_session()
+    if session is None:
+        return
+    written = []
+    for key in sorted(session.dirty):
+        before = shard_signature(key)
+        _write_json(_shard_path(key), session.cache[key])
+        written.append((key, session.changes.pop(key, []), before))
+    session.cache.clear()
+    session.dirty.clear()
+    session.indexes.clear()
+    session.changes.clear()
+    # 已落盘：按文件合并通知一次，仍持有各文件的锁
+    for key, changes, before in written:
+        _notify(key, changes, before)
+    session.locks.close()
+    session.locks = ExitStack()
+
+
+def shard_lock(key: str) -> _FileLock:
+    """分片的读写锁（跨进程）；MAIN_SHARD 即 db.json 的锁"""
+    if key == MAIN_SHARD:
+        return _DB_LOCK
+    with _SHARD_LOCKS_GUARD:
+        lock = _SHARD_LOCKS.get(key)
+        if lock is None:
+            lock = _SHARD_LOCKS[key] = _FileLock(lambda: _lock_path(key))
+        return lock
+
+
+def shard_signature(key: str) -> Optional[Tuple[int, int]]:
+    """分片文件的 (mtime_ns, size)，用于判断派生缓存是否过期（含手工编辑）"""
+    return _signature(_shard_path(key))
+
+
+def slot_shard_keys(content: Optional[str] = None) -> List[str]:
+    """存放档期的分片；按 content 分片且给定 content 时只返回该课程所在分片"""
+    if not _sharded():
+        return [MAIN_SHARD]
+    if content is not None and SHARD_BY == "content":
+        return [shard_key_for_slot({"content": content})]
+    return _list_shard_keys()
+
+
+def get_shard_slots(key: str) -> List[Dict[str, Any]]:
+    return _load_shard(key).get("slots", [])
+
+
+def add_slot_listener(listener: SlotListener) -> None:
+    """注册档期变更回调：每次写入档期所在文件后、仍持有该分片锁时调用（档期未变时 changes 为空）"""
+    _SLOT_LISTENERS.append(listener)
+
 
+def _notify(key: str, changes: SlotChanges, before: Optional[Tuple[int, int]]) -> None:
+    if SHARD_BY and key == MAIN_SHARD:
+        # 分片模式下 db.json 不存放档期
+        return
+    session = _current_session()
+    if session is not None and key in session.cache:
+        # 批量会话内的改动尚未落盘：攒到 checkpoint 写盘后再通知
+        session.changes.setdefault(key, []).extend(changes)
+        return
+    for listener in _SLOT_LISTENERS:
+        listener(key, changes, before)
+
+
+class _SlotRouter:
+    """分片模式下 slot_id → 分片键 的内存路由表，按分片文件签名增量刷新"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._shard_of: Dict[str, str] = {}
+        self._ids: Dict[str, Set[str]] = {}
+        self._signatures: Dict[str, Optional[Tuple[int, int]]] = {}
+
+    def _drop(self, key: str) -> None:
+        for slot_id in self._ids.pop(key, set()):
+            if self._shard_of.get(slot_id) == key:
+                del self._shard_of[slot_id]
+        self._signatures.pop(key, None)
+
+    def _refresh(self) -> None:
+        keys = _list_shard_keys()
+        for key in set(self._ids) - set(keys):
+            self._drop(key)
+        for key in keys:
+            if key in self._ids and self._signatures.get(key) == shard_signature(key):
+                continue
+            # 先取签名再读内容：读取前后若有并发写入，记下的是旧签名，下次 locate 会再刷新；
+            # 反过来会把旧内容与新签名配对，之后签名不再变化，这次变更就永远漏掉了
+            signature = shard_signature(key)
+            ids = {s.get("slot_id") for s in _read_shard_file(key).get("slots", [])}
+            self._drop(key)
+            self._ids[key] = ids
+            self._signatures[key] = signature
+            for slot_id in ids:
+                self._shard_of[slot_id] = key
+
+    def locate(self, slot_ids: Iterable[str]) -> Dict[str, str]:
+        with self._lock:
+            self._refresh()
+            return {i: self._shard_of[i] for i in slot_ids if i in self._shard_of}
+
+    def forget(self, keys: Iterable[str]) -> None:
+        """丢弃这些分片的路由，下次 locate 时按磁盘内容重新读取"""
+        with self._lock:
+            for key in keys:
+                self._drop(key)
+
+    def add(self, key: str, slot_ids: Iterable[str]) -> None:
+        with self._lock:
+            ids = self._ids.setdefault(key, set())
+            for slot_id in slot_ids:
+                ids.add(slot_id)
+                self._shard_of[slot_id] = key
+
+    def discard(self, key: str, slot_ids: Iterable[str]) -> None:
+        with self._lock:
+            ids = self._ids.get(key, set())
+            for slot_id in slot_ids:
+                ids.discard(slot_id)
+                if self._shard_of.get(slot_id) == key:
+                    del self._shard_of[slot_id]
+
+
+_ROUTER = _SlotRouter()
+_LAYOUT_CHECKED = False
+
+
+def _layout_path() -> Path:
+    # 不以 .json 结尾，不会被当作分片
+    return SHARD_DIR / "LAYOUT"
+
+
+def _read_layout() -> Optional[str]:
+    """分片目录记录的分片方式；未记录时返回 None"""
+    try:
+        return _layout_path().read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return None
+
+
+def _write_layout(mode: str) -> None:
+    path = _layout_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(mode + "\n", encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def check_layout() -> None:
+    """
+    启动检查：分片目录记录的分片方式必须与 SCHEDULE_SHARD_BY 一致，否则抛出 StorageError，
+    避免换了分片方式后部分档期“消失”。首次启用分片，或上次迁移中断时，自动（继续）迁移。
+    """
+    global _LAYOUT_CHECKED
+    if _LAYOUT_CHECKED:
+        return
+    # 与批量会话相同的加锁顺序：_BULK_LOCK → _DB_LOCK → 分片锁；进行中的导入结束后才检查/迁移
+    with _BULK_LOCK, _DB_LOCK:
+        if _LAYOUT_CHECKED:
+            return
+        recorded = _read_layout()
+        has_shards = bool(_list_shard_keys())
+        hint = "请停止服务后运行 python storage.py migrate 按当前 SCHEDULE_SHARD_BY 重新分布数据"
+        if not SHARD_BY:
+            if recorded or has_shards:
+                raise StorageError(
+                    f"{SHARD_DIR} 中有分片数据（分片方式：{recorded or '未记录'}），但未设置 SCHEDULE_SHARD_BY；"
+                    f"请设置 SCHEDULE_SHARD_BY={recorded or '<原分片方式>'}，或{hint}（合并回 db.json）"
+                )
+        elif recorded == SHARD_BY:
+            # db.json 中仍有档期：上次迁移中断，或档期被手工写进了 db.json
+            if _read_shard_file(MAIN_SHARD).get("slots"):
+                _relayout()
+        elif recorded is None and not has_shards:
+            _relayout()
+        else:
+            raise StorageError(
+                f"{SHARD_DIR} 按 {recorded or '未记录的方式'} 分片，与 SCHEDULE_SHARD_BY={SHARD_BY} 不一致；{hint}"
+            )
+        _LAYOUT_CHECKED = True
+
+
+def migrate() -> Dict[str, int]:
+    """按当前 SCHEDULE_SHARD_BY 重新分布全部档期与申请（未设置时合并回 db.json），返回各类记录数"""
+    global _LAYOUT_CHECKED
+    with _BULK_LOCK, _DB_LOCK:
+        counts = _relayout()
+        _LAYOUT_CHECKED = True
+    return counts
+
+
+def _sharded() -> bool:
+    """是否启用分片；首次调用时做分片方式检查（见 check_layout）"""
+    check_layout()
+    return bool(SHARD_BY)
+
+
+def _lock_all_shards(locks: ExitStack) -> List[str]:
+    """锁住当前存在的全部分片（加锁期间新出现的也一并锁住），返回分片键"""
+    locked: Set[str] = set()
+    while True:
+        keys = sorted(set(_list_shard_keys()) - locked)
+        if not keys:
+            return sorted(locked)
+        for key in keys:
+            locks.enter_context(shard_lock(key))
+            locked.add(key)
+
+
+def _relayout() -> Dict[str, int]:
+    """
+    从 db.json 与全部分片文件收集档期（按 slot_id 去重，db.json 中的优先）与申请（按内容去重），
+    再按当前分片方式写出。每一步都整文件重写、且不会在数据落到别处之前删除来源，
+    任何一步中断后重跑都得到相同结果，不会重复或丢失记录。
+    调用方持有 _BULK_LOCK 与 _DB_LOCK；这里再锁住新旧全部分片，其他进程的写入等到迁移结束。
+    """
+    global _ROUTER
+    with ExitStack() as locks:
+        old_keys = _lock_all_shards(locks)
+        db = _read_shard_file(MAIN_SHARD)
+        sources = [db] + [_read_shard_file(key) for key in old_keys]
+
+        slots: Dict[str, Dict[str, Any]] = {}
+        requests: Dict[bytes, Dict[str, Any]] = {}
+        for data in sources:
+            for slot in data.get("slots", []):
+                slots.setdefault(slot.get("slot_id"), slot)
+            for record in data.get("requests", []):
+                requests.setdefault(dumps(record), record)
+
+        # 1. 全部数据先落到 db.json，之后删除任何分片文件都不会丢数据
+        db["slots"] = list(slots.values())
+        db["requests"] = list(requests.values())
+        _write_json(DB_PATH, db)
+
+        # 2. 清掉旧的分片方式与分片文件
+        _layout_path().unlink(missing_ok=True)
+        for key in old_keys:
+            _shard_path(key).unlink(missing_ok=True)
+        _ROUTER = _SlotRouter()
+        counts = {"slots": len(slots), "requests": len(requests), "shards": 0}
+        if not SHARD_BY:
+            return counts
+
+        # 3. 写出新分片，记录分片方式，最后才从 db.json 移除档期及其申请
+        groups: Dict[str, Dict[str, Any]] = {}
+        shard_of: Dict[str, str] = {}
+        for slot_id, slot in slots.items():
+            key = shard_of[slot_id] = shard_key_for_slot(slot)
+            groups.setdefault(key, {"slots": [], "requests": []})["slots"].append(slot)
+        kept: List[Dict[str, Any]] = []
+        for record in requests.values():
+            key = shard_of.get(record.get("slot_id"))
+            if key is None:
+                kept.append(record)
+            else:
+                groups[key]["requests"].append(record)
+        for key in sorted(groups):
+            locks.enter_context(shard_lock(key))
+        for key, data in groups.items():
+            _write_json(_shard_path(key), data)
+        _write_layout(SHARD_BY)
+        del db["slots"]
+        db["requests"] = kept
+        _write_json(DB_PATH, db)
+        counts["shards"] = len(groups)
+        return counts
+
+
+# ========== 读取 ==========
 
 def get_courses() -> List[Dict[str, Any]]:
     return _load_db().get("courses", [])
 
 
-def get_slots() -> List[Dict[str, Any]]:
-    return _load_db().get("slots", [])
+def get_slots(content: Optional[str] = None) -> List[Dict[str, Any]]:
+    """全部档期；给定 content 时只返回该课程的档期（按 content 分片时只读对应分片）"""
+    slots = [s for key in slot_shard_keys(content) for s in get_shard_slots(key)]
+    if content is not None:
+        slots = [s for s in slots if s.get("content") == content]
+    return slots
+
+
+def iter_slots() -> Iterator[Dict[str, Any]]:
+    """逐分片产出全部档期，分片模式下同一时刻只加载一个分片"""
+    for key in slot_shard_keys():
+        yield from get_shard_slots(key)
 
 
 def get_requests() -> List[Dict[str, Any]]:
-    return _load_db().get("requests", [])
+    requests = list(_load_db().get("requests", []))
+    if _sharded():
+        for key in _list_shard_keys():
+            requests.extend(_load_shard(key).get("requests", []))
+    return requests
 
 
 def find_course_by_key(course_key: str) -> Optional[Dict[str, Any]]:
@@ -51,16 +556,267 @@ def find_course_by_student_name(student_name: str) -> Optional[Dict[str, Any]]:
 
 
 def find_slot_by_id(slot_id: str) -> Optional[Dict[str, Any]]:
-    for s in get_slots():
-        if s.get("slot_id") == slot_id:
-            return s
+    keys = [MAIN_SHARD]
+    if _sharded():
+        keys = list(_ROUTER.locate([slot_id]).values())
+    for key in keys:
+        for s in get_shard_slots(key):
+            if s.get("slot_id") == slot_id:
+                return s
     return None
 
 
-def append_request(record: Dict[str, Any]) -> None:
-    db = _load_db()
-    requests: List[Dict[str, Any]] = db.setdefault("requests", [])
-    requests.append(record)
-    _save_db(db)
+# ========== 写入 ==========
+
+def append_request(record: Dict[str, Any], slot: Optional[Dict[str, Any]] = None) -> None:
+    """追加一条申请记录；分片模式下有对应档期时写入该档期所在分片，否则写入 db.json"""
+    key = shard_key_for_slot(slot) if _sharded() and slot is not None else MAIN_SHARD
+    with shard_lock(key):
+        before = shard_signature(key)
+        data = _load_shard(key)
+        requests: List[Dict[str, Any]] = data.setdefault("requests", [])
+        requests.append(record)
+        _save_shard(key, data)
+        # 档期未变，但文件已改写：通知监听方刷新签名，避免误判为外部修改
+        _notify(key, [], before)
+
+
+# 合并函数：(已存储记录或 None, 新记录) -> 写入的记录；抛出 ValueError 表示拒绝该条
+Merge = Callable[[Optional[Dict[str, Any]], Dict[str, Any]], Dict[str, Any]]
+# 被拒绝的记录：(主键, 原因)
+Rejected = List[Tuple[str, str]]
+
+
+def _default_merge(old: Optional[Dict[str, Any]], record: Dict[str, Any]) -> Dict[str, Any]:
+    return record if old is None else {**old, **record}
+
+
+def _key_index(shard: str, collection: str, items: List[Dict[str, Any]], key_field: str) -> Dict[Any, int]:
+    """主键 → 下标；批量会话内按文件缓存，避免每块都对整个集合重建索引"""
+    session = _current_session()
+    if session is not None:
+        cached = session.indexes.get((shard, collection))
+        if cached is not None and cached[0] is items:
+            return cached[1]
+    index = {item.get(key_field): pos for pos, item in enumerate(items)}
+    if session is not None:
+        session.indexes[(shard, collection)] = (items, index)
+    return index
+
+
+def _merge_by_key(
+    items: List[Dict[str, Any]],
+    index: Dict[Any, int],
+    key_field: str,
+    records: Iterable[Dict[str, Any]],
+    merge: Merge,
+    rejected: Rejected,
+    changes: Optional[SlotChanges] = None,
+) -> Tuple[int, int]:
+    """按主键把 records 插入或合并进 items（index 随之更新），返回 (新增数, 更新数)"""
+    inserted = updated = 0
+    for record in records:
+        key = record[key_field]
+        pos = index.get(key)
+        old = None if pos is None else items[pos]
+        try:
+            merged = merge(old, record)
+        except ValueError as e:
+            rejected.append((key, str(e)))
+            continue
+        if pos is None:
+            index[key] = len(items)
+            items.append(merged)
+            inserted += 1
+        else:
+            items[pos] = merged
+            updated += 1
+        if changes is not None:
+            changes.append((old, merged))
+    return inserted, updated
+
+
+def _upsert_shard_slots(
+    key: str,
+    records: List[Dict[str, Any]],
+    merge: Merge,
+    rejected: Rejected,
+) -> SlotChanges:
+    """在单个分片内 upsert 档期，只读写该分片文件；返回实际写入的 (旧记录或 None, 新记录)"""
+    with shard_lock(key):
+        before = shard_signature(key)
+        data = _load_shard(key)
+        changes: SlotChanges = []
+        slots = data.setdefault("slots", [])
+        index = _key_index(key, "slots", slots, "slot_id")
+        _merge_by_key(slots, index, "slot_id", records, merge, rejected, changes)
+        _save_shard(key, data)
+        _notify(key, changes, before)
+        if SHARD_BY:
+            _ROUTER.add(key, [new["slot_id"] for _, new in changes])
+    return changes
+
+
+def _fold(
+    old: Optional[Dict[str, Any]],
+    records: List[Dict[str, Any]],
+    merge: Merge,
+    rejected: Rejected,
+) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    把同一 slot_id 的多条记录依次合并到 old 上（与 _merge_by_key 相同：被拒绝的一条
+    不影响前后各条），返回 (最终记录, 被接受的记录)
+    """
+    current = old
+    accepted: List[Dict[str, Any]] = []
+    for record in records:
+        try:
+            current = merge(current, record)
+        except ValueError as e:
+            rejected.append((record["slot_id"], str(e)))
+            continue
+        accepted.append(record)
+    return current, accepted
+
+
+def _update_shard_slots(
+    key: str,
+    groups: Dict[str, List[Dict[str, Any]]],
+    merge: Merge,
+    rejected: Rejected,
+) -> Tuple[int, int, Dict[str, Dict[str, Any]]]:
+    """
+    更新分片内已有的档期：每个 slot_id 的各条记录依次与旧记录合并，由最终记录决定所属分片；
+    仍属本分片的原地更新，换分片的从本分片移除。
+    返回 (新增数, 更新数, {slot_id: 需写入其他分片的完整记录})
+    """
+    with shard_lock(key):
+        before = shard_signature(key)
+        data = _load_shard(key)
+        slots = data.setdefault("slots", [])
+        index = _key_index(key, "slots", slots, "slot_id")
+        changes: SlotChanges = []
+        moved: Dict[str, Dict[str, Any]] = {}
+        inserted = updated = 0
+        for slot_id, records in groups.items():
+            pos = index.get(slot_id)
+            old = None if pos is None else slots[pos]
+            final, accepted = _fold(old, records, merge, rejected)
+            if not accepted:
+                continue
+            # 计数与非分片模式一致：首条落在不存在的档期上算新增，其余每条算一次更新
+            inserted += old is None
+            updated += len(accepted) - (old is None)
+            if shard_key_for_slot(final) != key:
+                moved[slot_id] = final
+                if old is not None:
+                    changes.append((old, None))
+            elif pos is None:
+                index[slot_id] = len(slots)
+                slots.append(final)
+                changes.append((None, final))
+            else:
+                slots[pos] = final
+                changes.append((old, final))
+        if changes:
+            if moved:
+                data["slots"] = [s for s in slots if s.get("slot_id") not in moved]
+            _save_shard(key, data)
+            _notify(key, changes, before)
+        _ROUTER.add(key, [new["slot_id"] for _, new in changes if new is not None])
+        _ROUTER.discard(key, moved)
+    return inserted, updated, moved
+
+
+def upsert_courses(
+    records: Iterable[Dict[str, Any]],
+    merge: Merge = _default_merge,
+) -> Tuple[int, int, Rejected]:
+    """按 course_key 批量插入或更新课程，返回 (新增数, 更新数, 被拒绝的记录)"""
+    rejected: Rejected = []
+    with _DB_LOCK:
+        before = shard_signature(MAIN_SHARD)
+        db = _load_db()
+        courses = db.setdefault("courses", [])
+        index = _key_index(MAIN_SHARD, "courses", courses, "course_key")
+        inserted, updated = _merge_by_key(courses, index, "course_key", records, merge, rejected)
+        _save_db(db)
+        _notify(MAIN_SHARD, [], before)
+    return inserted, updated, rejected
+
+
+def upsert_slots(
+    records: Iterable[Dict[str, Any]],
+    merge: Merge = _default_merge,
+) -> Tuple[int, int, Rejected]:
+    """
+    按 slot_id 批量插入或更新档期，返回 (新增数, 更新数, 被拒绝的记录)。
+    merge 决定新记录如何与已存储记录合并，可抛出 ValueError 拒绝单条记录。
+    分片模式下按分片分组，每组只读写对应分片；content/location 变化导致换分片的档期
+    会先与旧记录合并、从原分片移除，再写入新分片。
+    """
+    rejected: Rejected = []
+    if not _sharded():
+        changes = _upsert_shard_slots(MAIN_SHARD, list(records), merge, rejected)
+        inserted = sum(1 for old, _ in changes if old is None)
+        return inserted, len(changes) - inserted, rejected
+
+    # 同一 slot_id 的多条记录按出现顺序依次合并，由合并后的最终记录决定所属分片
+    rows: Dict[str, List[Dict[str, Any]]] = {}
+    for record in records:
+        rows.setdefault(record["slot_id"], []).append(record)
+
+    located = _ROUTER.locate(rows)
+    existing: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for slot_id, group in rows.items():
+        source = located.get(slot_id)
+        if source is not None:
+            existing.setdefault(source, {})[slot_id] = group
+            continue
+        final, accepted = _fold(None, group, merge, rejected)
+        if accepted:
+            # 被接受的各条交给目标分片重放，结果与上面的预合并一致
+            groups.setdefault(shard_key_for_slot(final), []).extend(accepted)
+
+    inserted = updated = 0
+    moves: Dict[str, List[Dict[str, Any]]] = {}
+    for source, group in existing.items():
+        n_inserted, n_updated, moved = _update_shard_slots(source, group, merge, rejected)
+        inserted += n_inserted
+        updated += n_updated
+        for record in moved.values():
+            moves.setdefault(shard_key_for_slot(record), []).append(record)
+
+    # 换分片的档期已在原分片合并完毕并计数，原样写入新分片
+    for key, group in moves.items():
+        _upsert_shard_slots(key, group, lambda old, record: record, rejected)
+    for key, group in groups.items():
+        for old, _ in _upsert_shard_slots(key, group, merge, rejected):
+            if old is None:
+                inserted += 1
+            else:
+                updated += 1
+    return inserted, updated, rejected
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="存储维护")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser(
+        "migrate",
+        help="按当前 SCHEDULE_SHARD_BY 重新分布档期与申请（未设置时合并回 db.json）；请先停止服务",
+    )
+    parser.parse_args(argv)
+
+    counts = migrate()
+    mode = SHARD_BY or "db.json"
+    print(
+        f"已按 {mode} 重新分布：档期 {counts['slots']} 条，申请 {counts['requests']} 条，分片 {counts['shards']} 个",
+        file=sys.stderr,
+    )
+    return 0
 
 
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,32 @@
+"""测试夹具：每个用例使用临时目录中的 db.json / 分片目录，互不影响"""
+
+import shutil
+from pathlib import Path
+
+import pytest
+
+import availability
+import storage
+
+SAMPLE_DB = Path(__file__).resolve().parent.parent / "data" / "db.json"
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """以仓库自带的 data/db.json 为初始数据的临时存储（非分片模式）"""
+    db_path = tmp_path / "db.json"
+    shutil.copy(SAMPLE_DB, db_path)
+    monkeypatch.setattr(storage, "DB_PATH", db_path)
+    monkeypatch.setattr(storage, "SHARD_DIR", tmp_path / "shards")
+    monkeypatch.setattr(storage, "SHARD_BY", "")
+    monkeypatch.setattr(storage, "_ROUTER", storage._SlotRouter())
+    monkeypatch.setattr(storage, "_LAYOUT_CHECKED", False)
+    monkeypatch.setattr(availability._INDEX, "_partitions", {})
+    return tmp_path
+
+
+@pytest.fixture
+def sharded_store(store, monkeypatch, request):
+    """分片模式的临时存储；默认按 content 分片，可用 indirect 参数指定 campus"""
+    monkeypatch.setattr(storage, "SHARD_BY", getattr(request, "param", "content"))
+    return store
@@ -0,0 +1,47 @@
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("fastmcp")
+pytest.importorskip("httpx")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import app as app_module  # noqa: E402
+import storage  # noqa: E402
+
+CSV = "slot_id,time,teacher,content,capacity\nS_API,2026-03-01 10:00,李老师,初中数学,4\n"
+
+
+@pytest.fixture
+def client(store):
+    return TestClient(app_module.app)
+
+
+@pytest.mark.parametrize("method, url", [
+    ("post", "/api/admin/import?kind=slots&format=csv"),
+    ("get", "/api/admin/export?kind=slots"),
+])
+def test_admin_endpoints_disabled_without_token(client, monkeypatch, method, url):
+    monkeypatch.setattr(app_module, "ADMIN_TOKEN", "")
+    resp = getattr(client, method)(url, headers={"Authorization": "Bearer anything"})
+    assert resp.status_code == 403
+
+
+@pytest.mark.parametrize("headers", [{}, {"Authorization": "Bearer wrong"}, {"Authorization": "secret"}])
+def test_admin_import_rejects_bad_token(client, monkeypatch, headers):
+    monkeypatch.setattr(app_module, "ADMIN_TOKEN", "secret")
+    resp = client.post("/api/admin/import?kind=slots&format=csv", content=CSV, headers=headers)
+    assert resp.status_code == 401
+    assert storage.find_slot_by_id("S_API") is None
+
+
+def test_admin_import_and_export_with_token(client, monkeypatch):
+    monkeypatch.setattr(app_module, "ADMIN_TOKEN", "secret")
+    auth = {"Authorization": "Bearer secret"}
+    resp = client.post("/api/admin/import?kind=slots&format=csv", content=CSV, headers=auth)
+    assert resp.status_code == 200
+    assert resp.text.strip().splitlines()[-1].startswith('{"event":"done"')
+
+    resp = client.get("/api/admin/export?kind=slots&format=jsonl", headers=auth)
+    assert resp.status_code == 200
+    assert '"S_API"' in resp.text
@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("fastmcp")
+pytest.importorskip("httpx")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import app as app_module  # noqa: E402
+
+
+def _off_event_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return True
+    return False
+
+
+@pytest.fixture
+def client(store):
+    return TestClient(app_module.app)
+
+
+@pytest.mark.parametrize("name, method, url, kwargs", [
+    ("submit_schedule_change_impl", "post", "/api/submit-schedule-change",
+     {"json": {"student_name": "张三", "target_date": "2026-01-12"}}),
+    ("query_available_slots_impl", "get",
+     "/api/query-available-slots?course_name=初中数学&original_date=2026-01-10&target_date=2026-01-12", {}),
+    ("query_availability_calendar", "get",
+     "/api/availability-calendar?course_name=初中数学&start_date=2026-01-01&end_date=2026-01-31", {}),
+])
+def test_storage_work_runs_off_event_loop(client, monkeypatch, name, method, url, kwargs):
+    real = getattr(app_module, name)
+    seen = []
+
+    def spy(*args, **kw):
+        seen.append(_off_event_loop())
+        return real(*args, **kw)
+
+    monkeypatch.setattr(app_module, name, spy)
+    getattr(client, method)(url, **kwargs)
+    assert seen == [True]
@@ -0,0 +1,175 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+import availability
+import storage
+from availability import _CourseCalendar, _Fenwick, query_availability_calendar
+from serialization import dumps, loads
+
+COURSE = "初中数学"
+
+
+def _brute_force(course, start, end):
+    """直接遍历全部档期得到的逐日合计，作为日历结果的对照"""
+    per_day = {}
+    for slot in storage.get_slots():
+        day = slot["time"][:10]
+        if slot["content"] == course and start <= day <= end:
+            acc = per_day.setdefault(day, [0, 0, 0])
+            acc[0] += 1
+            acc[1] += slot["capacity"]
+            acc[2] += slot["booked"]
+    return [
+        {"date": d, "slots": s, "capacity": c, "booked": b, "remaining": c - b}
+        for d, (s, c, b) in sorted(per_day.items())
+    ]
+
+
+def _check(course, start, end):
+    result = query_availability_calendar(course, start, end)
+    expected = _brute_force(course, start, end)
+    assert result["days"] == expected
+    for m in ("slots", "capacity", "booked", "remaining"):
+        assert result["totals"][m] == sum(d[m] for d in expected)
+    return result
+
+
+def _random_slots(n, seed=0):
+    rng = random.Random(seed)
+    contents = [COURSE, "高中物理", "初中英语"]
+    return [
+        {
+            "slot_id": f"R{i}",
+            "time": f"{date(2026, 1, 1) + timedelta(days=rng.randrange(400))} 10:00",
+            "teacher": "李老师",
+            "content": rng.choice(contents),
+            "capacity": rng.randrange(1, 10),
+            "booked": 0,
+            "location": f"{rng.choice(['教学楼', '实验楼'])} A-{i % 7}",
+        }
+        for i in range(n)
+    ]
+
+
+def _edit_db(path, edit):
+    db = loads(path.read_bytes())
+    edit(db)
+    path.write_bytes(dumps(db, pretty=True))
+
+
+def test_fenwick_prefix_sums():
+    values = [random.Random(1).randrange(-5, 10) for _ in range(37)]
+    tree = _Fenwick(values)
+    for end in range(len(values) + 1):
+        assert tree.prefix(end) == sum(values[:end])
+    tree.add(10, 7)
+    values[10] += 7
+    assert [tree.prefix(e) for e in range(len(values) + 1)] == [sum(values[:e]) for e in range(len(values) + 1)]
+
+
+def test_course_calendar_grows_geometrically(monkeypatch):
+    builds = []
+
+    class CountingFenwick(_Fenwick):
+        def __init__(self, values):
+            builds.append(len(values))
+            super().__init__(values)
+
+    monkeypatch.setattr(availability, "_Fenwick", CountingFenwick)
+    calendar = _CourseCalendar(date(2026, 1, 1), 1)
+    for i in range(2000):
+        calendar.add(date(2026, 1, 1) + timedelta(days=i), (1, 2, 1))
+        calendar.add(date(2026, 1, 1) - timedelta(days=i), (1, 2, 1))
+
+    # 每次重建三棵树；逐天双向扩展时重建次数只随天数对数增长
+    assert len(builds) <= 3 * 20
+    days, totals = calendar.query(date(2020, 1, 1), date(2032, 1, 1))
+    assert totals["slots"] == 4000
+    assert len(days) == 3999
+
+
+def test_calendar_matches_brute_force(store):
+    storage.upsert_slots(_random_slots(300))
+    _check(COURSE, "2026-01-01", "2026-12-31")
+    _check(COURSE, "2026-03-15", "2026-04-02")
+    _check("高中物理", "2026-06-01", "2027-01-31")
+    assert _check("不存在的课程", "2026-01-01", "2026-12-31")["days"] == []
+
+
+def test_upserts_update_calendar_incrementally(store, monkeypatch):
+    _check(COURSE, "2026-01-01", "2026-12-31")
+    rebuilds = []
+    monkeypatch.setattr(availability._Partition, "rebuild", lambda self, key: rebuilds.append(key))
+
+    storage.upsert_slots(_random_slots(50, seed=2))
+    storage.upsert_slots([{"slot_id": "R3", "booked": 1}, {"slot_id": "R4", "time": "2026-02-02 10:00"}])
+    _check(COURSE, "2026-01-01", "2026-12-31")
+    assert rebuilds == []
+
+
+def test_append_request_keeps_index_valid(store, monkeypatch):
+    _check(COURSE, "2026-01-01", "2026-12-31")
+    slot = storage.find_slot_by_id("SLOT_2026_01_10_MATH_MS")
+    rebuilds = []
+    monkeypatch.setattr(availability._Partition, "rebuild", lambda self, key: rebuilds.append(key))
+
+    storage.append_request({"student_name": "张三", "slot_id": slot["slot_id"], "status": "PENDING_AUDIT"}, slot=slot)
+    _check(COURSE, "2026-01-01", "2026-12-31")
+    assert rebuilds == []
+
+
+def test_external_edit_triggers_rebuild(store):
+    _check(COURSE, "2026-01-01", "2026-12-31")
+
+    def edit(db):
+        db["slots"][0]["capacity"] = 99
+        db["slots"].append({**db["slots"][0], "slot_id": "HAND_EDITED", "time": "2026-05-05 10:00"})
+
+    _edit_db(store / "db.json", edit)
+    result = _check(COURSE, "2026-01-01", "2026-12-31")
+    assert {"date": "2026-05-05", "slots": 1, "capacity": 99, "booked": 5, "remaining": 94} in result["days"]
+
+
+def test_hand_edited_bad_slots_are_skipped(store):
+    def edit(db):
+        base = {"teacher": "李老师", "content": COURSE, "booked": 0, "location": ""}
+        db["slots"] += [
+            {**base, "slot_id": "ANCIENT", "time": "0001-01-01 10:00", "capacity": 5},
+            {**base, "slot_id": "FUTURE", "time": "9999-12-31 10:00", "capacity": 5},
+            {**base, "slot_id": "BAD_CAPACITY", "time": "2026-01-10 10:00", "capacity": "八"},
+        ]
+
+    _edit_db(store / "db.json", edit)
+    result = query_availability_calendar(COURSE, "2026-01-01", "2026-12-31")
+    without_bad = [s for s in storage.get_slots() if s["slot_id"] not in ("ANCIENT", "FUTURE", "BAD_CAPACITY")]
+    jan_10 = [s for s in without_bad if s["content"] == COURSE and s["time"].startswith("2026-01-10")]
+    day = next(d for d in result["days"] if d["date"] == "2026-01-10")
+    assert day["slots"] == len(jan_10)
+    assert day["capacity"] == sum(s["capacity"] for s in jan_10)
+
+    # 正常档期的后续增量更新不受影响
+    storage.upsert_slots([{"slot_id": "SLOT_2026_01_10_MATH_MS", "booked": 6}])
+    day = next(d for d in query_availability_calendar(COURSE, "2026-01-01", "2026-12-31")["days"]
+               if d["date"] == "2026-01-10")
+    assert day["booked"] == sum(s["booked"] for s in jan_10) + 1
+
+
+@pytest.mark.parametrize("sharded_store", ["content", "campus"], indirect=True)
+def test_calendar_across_shards(sharded_store):
+    storage.upsert_slots(_random_slots(200, seed=3))
+    _check(COURSE, "2026-01-01", "2026-12-31")
+    storage.upsert_slots([{"slot_id": "R5", "location": "图书馆 B-1"}, {"slot_id": "R6", "content": "高中物理"}])
+    _check(COURSE, "2026-01-01", "2026-12-31")
+    _check("高中物理", "2026-01-01", "2026-12-31")
+
+
+@pytest.mark.parametrize("start, end", [
+    ("2026/01/01", "2026-01-31"),
+    ("2026-02-01", "2026-01-31"),
+    ("2026-01-01", "2027-01-02"),
+])
+def test_invalid_ranges_rejected(store, start, end):
+    with pytest.raises(ValueError):
+        query_availability_calendar(COURSE, start, end)
@@ -0,0 +1,181 @@
+import io
+
+import pytest
+
+import bulk_io
+import storage
+from availability import query_availability_calendar
+
+SLOT_ID = "SLOT_2026_01_10_MATH_MS"
+
+
+def _import(text, kind="slots", fmt="csv", chunk_size=bulk_io.DEFAULT_CHUNK_SIZE):
+    return list(bulk_io.import_records(io.StringIO(text), kind, fmt, chunk_size))
+
+
+def test_partial_update_keeps_unspecified_fields(store):
+    events = _import(f"slot_id,time,teacher,content,capacity\n{SLOT_ID},2026-01-10 09:00,李老师,初中数学,10\n")
+
+    assert events[-1]["updated"] == 1 and events[-1]["invalid"] == 0
+    slot = storage.find_slot_by_id(SLOT_ID)
+    assert slot["capacity"] == 10
+    assert slot["booked"] == 5
+    assert slot["location"] == "教学楼 A-101"
+
+
+def test_booked_checked_against_merged_record(store):
+    events = _import(f"slot_id,capacity\n{SLOT_ID},3\n")
+
+    assert events[-1]["invalid"] == 1
+    assert events[-1]["errors"][0]["line"] == 2
+    assert storage.find_slot_by_id(SLOT_ID)["capacity"] == 8
+
+
+def test_insert_requires_fields_and_applies_defaults(store):
+    text = (
+        '{"slot_id": "NEW_1", "time": "2026-03-01 10:00", "teacher": "李老师", "content": "初中数学", "capacity": 4}\n'
+        '{"slot_id": "NEW_2", "time": "2026-03-01 10:00"}\n'
+    )
+    events = _import(text, fmt="jsonl")
+
+    assert events[-1]["inserted"] == 1
+    assert events[-1]["errors"][0]["line"] == 2
+    assert storage.find_slot_by_id("NEW_1") == {
+        "slot_id": "NEW_1",
+        "time": "2026-03-01 10:00",
+        "teacher": "李老师",
+        "content": "初中数学",
+        "capacity": 4,
+        "booked": 0,
+        "location": "",
+    }
+    assert storage.find_slot_by_id("NEW_2") is None
+
+
+@pytest.mark.parametrize("row, message", [
+    ("X,2026-02-01,t,c,5,1", "time"),
+    ("X,0001-01-01 10:00,t,c,5,1", "time"),
+    ("X,2100-01-01 10:00,t,c,5,1", "time"),
+    ("X,2026-02-01 10:00,t,c,-1,0", "capacity"),
+    ("X,2026-02-01 10:00,t,c,five,0", "capacity"),
+    ("X,2026-02-01 10:00,t,c,5,9", "booked"),
+])
+def test_invalid_rows_are_skipped_and_reported(store, row, message):
+    events = _import(f"slot_id,time,teacher,content,capacity,booked\n{row}\n")
+
+    assert events[-1]["invalid"] == 1
+    assert message in events[-1]["errors"][0]["error"]
+    assert storage.find_slot_by_id("X") is None
+
+
+def test_progress_per_chunk(store):
+    rows = "".join(f"N{i},2026-03-{i + 1:02d} 10:00,t,初中数学,5,0\n" for i in range(5))
+    events = _import("slot_id,time,teacher,content,capacity,booked\n" + rows, chunk_size=2)
+
+    assert [e["event"] for e in events] == ["progress"] * 3 + ["done"]
+    assert events[-1]["inserted"] == 5
+
+
+def test_bad_json_lines(store):
+    events = _import('{"course_key": "C9", "student_name": "a", "content": "b", "teacher": "c"}\nnot json\n[1]\n',
+                     kind="courses", fmt="jsonl")
+
+    assert events[-1]["inserted"] == 1
+    assert [e["line"] for e in events[-1]["errors"]] == [2, 3]
+
+
+def test_export_round_trip(store):
+    exported = "".join(bulk_io.export_records("slots", "csv", chunk_size=7))
+    before = storage.get_slots()
+
+    events = _import(exported)
+
+    assert events[-1]["updated"] == len(before) and events[-1]["invalid"] == 0
+    assert storage.get_slots() == before
+
+
+def test_rejects_unknown_kind_or_format(store):
+    with pytest.raises(ValueError):
+        bulk_io.export_records("teachers")
+    with pytest.raises(ValueError):
+        bulk_io.import_records(io.StringIO(""), "slots", "xml")
+
+
+def _rows(n):
+    return "slot_id,time,teacher,content,capacity,booked\n" + "".join(
+        f"N{i},2026-03-{i % 28 + 1:02d} 10:00,t,初中数学,5,0\n" for i in range(n)
+    )
+
+
+def test_import_loads_once_and_writes_at_checkpoints(store, monkeypatch):
+    reads, writes = [], []
+    real_read, real_write = storage._read_json, storage._write_json
+    monkeypatch.setattr(storage, "_read_json", lambda path: reads.append(path) or real_read(path))
+    monkeypatch.setattr(storage, "_write_json", lambda path, data: writes.append(path) or real_write(path, data))
+
+    events = list(bulk_io.import_records(io.StringIO(_rows(10)), "slots", "csv", chunk_size=2, checkpoint_every=2))
+
+    assert [e["saved"] for e in events] == [0, 2, 2, 4, 4, 5]
+    # 每个 checkpoint 窗口只加载一次 db.json，写盘发生在第 2、4 块及结束时
+    assert len(reads) == 3
+    assert len(writes) == 3
+    assert len(storage.get_slots()) == 220
+
+
+def _march_calendar():
+    return query_availability_calendar("初中数学", "2026-03-01", "2026-03-31")["totals"]
+
+
+def test_aborted_import_keeps_only_checkpointed_chunks(store):
+    before = _march_calendar()
+    events = bulk_io.import_records(io.StringIO(_rows(10)), "slots", "csv", chunk_size=2, checkpoint_every=2)
+    for event in events:
+        if event["chunks"] == 3:
+            break
+    events.close()
+
+    assert len(storage.get_slots()) == 214
+    # 第 3 块（N4、N5）未落盘：日历与查找都不能看到它
+    after = _march_calendar()
+    assert (after["slots"], after["capacity"]) == (before["slots"] + 4, before["capacity"] + 20)
+    assert storage.find_slot_by_id("N3") is not None
+    assert storage.find_slot_by_id("N4") is None
+
+
+def _failing_stream(text):
+    yield from io.StringIO(text)
+    raise OSError("connection reset")
+
+
+def test_failed_import_leaves_calendar_untouched(store):
+    before = query_availability_calendar("初中数学", "2026-01-01", "2026-12-31")["totals"]
+    row = "slot_id,time,teacher,content,capacity\nBIG,2026-01-20 10:00,李老师,初中数学,50\n"
+
+    with pytest.raises(OSError):
+        list(bulk_io.import_records(_failing_stream(row), "slots", "csv", chunk_size=1, checkpoint_every=100))
+
+    assert storage.find_slot_by_id("BIG") is None
+    assert query_availability_calendar("初中数学", "2026-01-01", "2026-12-31")["totals"] == before
+
+
+def test_failed_move_keeps_router_on_disk_state(sharded_store):
+    assert storage.find_slot_by_id(SLOT_ID)["content"] == "初中数学"
+    row = f'{{"slot_id": "{SLOT_ID}", "content": "高中物理"}}\n'
+
+    with pytest.raises(OSError):
+        list(bulk_io.import_records(_failing_stream(row), "slots", "jsonl", chunk_size=1, checkpoint_every=100))
+
+    slot = storage.find_slot_by_id(SLOT_ID)
+    assert slot is not None and slot["content"] == "初中数学"
+    _import(f"slot_id,booked\n{SLOT_ID},6\n")
+    assert [s["slot_id"] for s in storage.get_slots()].count(SLOT_ID) == 1
+
+
+def test_run_in_worker_drives_import_on_one_thread(store):
+    events = bulk_io.import_records(io.StringIO(_rows(6)), "slots", "csv", chunk_size=2)
+    finished = []
+
+    result = list(bulk_io.run_in_worker(events, on_finish=lambda: finished.append(True)))
+
+    assert result[-1]["event"] == "done" and result[-1]["inserted"] == 6
+    assert finished == [True]
@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+import serialization
+
+CASES = [
+    {"courses": [], "slots": [{"slot_id": "S1", "content": "初中数学", "capacity": 8, "booked": 0}], "requests": []},
+    {"nested": {"list": [1, 2.5, True, None, "教学楼 A-101"], "empty": {}}},
+    {1: "int key", 2.5: "float key", True: "bool key", None: "none key"},
+    {"big": [2 ** 64, -(2 ** 70)], "edge": [2 ** 63 - 1, -(2 ** 63)]},
+    [{"quote": "\"\\\n\t", "emoji": "📅"}],
+]
+
+
+def _stdlib(obj, pretty):
+    if pretty:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+@pytest.fixture(params=["orjson", "json"])
+def backend(request, monkeypatch):
+    if request.param == "orjson":
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(serialization, "orjson", None)
+    return request.param
+
+
+@pytest.mark.parametrize("pretty", [False, True])
+@pytest.mark.parametrize("obj", CASES)
+def test_dumps_matches_stdlib(backend, obj, pretty):
+    assert serialization.dumps(obj, pretty=pretty) == _stdlib(obj, pretty)
+
+
+@pytest.mark.parametrize("obj", CASES)
+def test_loads_round_trip(backend, obj):
+    assert serialization.loads(serialization.dumps(obj)) == json.loads(_stdlib(obj, False))
+
+
+def test_dumps_unserializable_raises_type_error(backend):
+    with pytest.raises(TypeError):
+        serialization.dumps({"x": object()})
+
+
+def test_loads_invalid_raises_json_decode_error(backend):
+    with pytest.raises(serialization.JSONDecodeError):
+        serialization.loads(b'{"slots": [')
@@ -0,0 +1,61 @@
+import os
+import threading
+
+import pytest
+
+import storage
+
+fcntl = pytest.importorskip("fcntl")
+
+
+def _try_flock(path):
+    """在另一个打开的文件描述上尝试加锁（flock 按打开的文件描述互斥，等同另一个进程）"""
+    fd = os.open(path, os.O_RDWR | os.O_CREAT)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    finally:
+        os.close(fd)
+    return True
+
+
+@pytest.mark.parametrize("key", [storage.MAIN_SHARD, "初中数学"])
+def test_shard_lock_holds_file_lock(store, key):
+    lock_path = storage._lock_path(key)
+    with storage.shard_lock(key):
+        with storage.shard_lock(key):  # 可重入，内层释放不放掉文件锁
+            pass
+        assert lock_path.exists()
+        assert not _try_flock(lock_path)
+    assert _try_flock(lock_path)
+
+
+def test_file_lock_follows_db_path(store):
+    assert storage._lock_path(storage.MAIN_SHARD) == store / "db.json.lock"
+    assert storage._lock_path("a/b") == store / "shards" / "a%2Fb.json.lock"
+
+
+def test_shard_lock_excludes_other_threads(store):
+    entered = threading.Event()
+
+    def worker():
+        with storage.shard_lock(storage.MAIN_SHARD):
+            entered.set()
+
+    with storage.shard_lock(storage.MAIN_SHARD):
+        t = threading.Thread(target=worker, daemon=True)
+        t.start()
+        assert not entered.wait(0.2)
+    assert entered.wait(5)
+    t.join(5)
+
+
+def test_bulk_session_holds_file_locks_until_checkpoint(store):
+    lock_path = storage._lock_path(storage.MAIN_SHARD)
+    with storage.bulk_session():
+        storage.upsert_courses([{"course_key": "C_LOCK", "student_name": "锁", "content": "x", "teacher": "y"}])
+        assert not _try_flock(lock_path)
+        storage.checkpoint()
+        assert _try_flock(lock_path)
+    assert storage.find_course_by_key("C_LOCK") is not None
@@ -0,0 +1,319 @@
+import io
+import os
+import shutil
+import threading
+
+import pytest
+
+import bulk_io
+import storage
+from serialization import loads
+
+SLOT_ID = "SLOT_2026_01_10_MATH_MS"
+REQUESTED_SLOT = "SLOT_2026_01_11_MATH_MS"
+
+
+def _read(path):
+    return loads(path.read_bytes())
+
+
+def _snapshot():
+    """与存储布局无关的全部档期与申请，用于比较迁移前后"""
+    slots = sorted(storage.get_slots(), key=lambda s: s["slot_id"])
+    requests = sorted(storage.get_requests(), key=lambda r: (r.get("slot_id") or "", r.get("timestamp") or ""))
+    return slots, requests
+
+
+@pytest.fixture
+def baseline(store):
+    return _snapshot()
+
+
+def _reset(monkeypatch, mode):
+    monkeypatch.setattr(storage, "SHARD_BY", mode)
+    monkeypatch.setattr(storage, "_LAYOUT_CHECKED", False)
+
+
+def test_first_enable_migrates_db_json(baseline, monkeypatch, store):
+    _reset(monkeypatch, "content")
+    assert _snapshot() == baseline
+
+    db = _read(store / "db.json")
+    assert "slots" not in db
+    assert (store / "shards" / "LAYOUT").read_text(encoding="utf-8").strip() == "content"
+    shard = _read(storage._shard_path("初中数学"))
+    assert any(s["slot_id"] == SLOT_ID for s in shard["slots"])
+    assert any(r["slot_id"] == REQUESTED_SLOT for r in shard["requests"])
+    assert all(s["content"] == "初中数学" for s in shard["slots"])
+
+
+def _fail(*args, **kwargs):
+    raise OSError("disk full")
+
+
+@pytest.mark.parametrize("fail_at", ["_write_layout", "unlink"])
+def test_interrupted_migration_is_idempotent(baseline, monkeypatch, store, fail_at):
+    _reset(monkeypatch, "content")
+    if fail_at == "unlink":
+        # 已按 content 分片，改为 campus 时在删除旧分片文件的中途失败
+        storage.check_layout()
+        _reset(monkeypatch, "campus")
+    with monkeypatch.context() as m:
+        if fail_at == "unlink":
+            m.setattr(type(store), "unlink", _fail)
+        else:
+            m.setattr(storage, "_write_layout", _fail)
+        with pytest.raises(OSError):
+            storage.migrate()
+
+    # 重跑迁移：记录不重复、不丢失
+    _reset(monkeypatch, "content")
+    storage.migrate()
+    assert _snapshot() == baseline
+    storage.migrate()
+    assert _snapshot() == baseline
+
+
+def test_resume_when_layout_recorded_but_db_still_has_slots(baseline, monkeypatch, store):
+    _reset(monkeypatch, "content")
+    storage.check_layout()
+    # 模拟迁移在最后一步（从 db.json 移除档期）之前中断
+    db = _read(store / "db.json")
+    db["slots"], db["requests"] = baseline
+    storage._write_json(store / "db.json", db)
+
+    _reset(monkeypatch, "content")
+    assert _snapshot() == baseline
+    assert "slots" not in _read(store / "db.json")
+
+
+@pytest.mark.parametrize("new_mode", ["", "campus"])
+def test_mode_change_refuses_to_start(baseline, monkeypatch, new_mode):
+    _reset(monkeypatch, "content")
+    storage.check_layout()
+
+    _reset(monkeypatch, new_mode)
+    with pytest.raises(storage.StorageError, match="python storage.py migrate"):
+        storage.get_slots()
+    with pytest.raises(storage.StorageError):
+        storage.upsert_slots([{"slot_id": "X", "content": "初中数学"}])
+
+
+def test_unrecorded_shards_refuse_to_start(baseline, monkeypatch, store):
+    (store / "shards").mkdir()
+    storage._write_json(store / "shards" / "初中数学.json", {"slots": [], "requests": []})
+    _reset(monkeypatch, "content")
+    with pytest.raises(storage.StorageError, match="未记录"):
+        storage.check_layout()
+
+
+@pytest.mark.parametrize("modes", [("content", "campus", ""), ("campus", "content", "")])
+def test_migrate_between_modes_keeps_all_records(baseline, monkeypatch, store, modes):
+    for mode in modes:
+        _reset(monkeypatch, mode)
+        storage.migrate()
+        assert _snapshot() == baseline
+    assert not list((store / "shards").glob("*.json"))
+    assert not (store / "shards" / "LAYOUT").exists()
+
+
+def test_migrate_cli(baseline, monkeypatch, capsys):
+    _reset(monkeypatch, "campus")
+    assert storage.main(["migrate"]) == 0
+    assert "campus" in capsys.readouterr().err
+    assert _snapshot() == baseline
+
+
+@pytest.mark.parametrize("sharded_store", ["content", "campus"], indirect=True)
+def test_cross_shard_move(sharded_store):
+    field, value = ("content", "高中物理") if storage.SHARD_BY == "content" else ("location", "实验楼 B-2")
+    source = storage.shard_key_for_slot(storage.find_slot_by_id(SLOT_ID))
+
+    inserted, updated, rejected = storage.upsert_slots([{"slot_id": SLOT_ID, field: value}])
+    assert (inserted, updated, rejected) == (0, 1, [])
+    slot = storage.find_slot_by_id(SLOT_ID)
+    target = storage.shard_key_for_slot(slot)
+    assert target != source
+    assert slot[field] == value and slot["booked"] == 5
+    assert [s["slot_id"] for s in storage.get_slots()].count(SLOT_ID) == 1
+    assert SLOT_ID not in {s["slot_id"] for s in storage.get_shard_slots(source)}
+
+
+def test_rejected_move_stays_in_source_shard(sharded_store):
+    def reject(old, record):
+        raise ValueError("nope")
+
+    _, _, rejected = storage.upsert_slots([{"slot_id": SLOT_ID, "content": "高中物理"}], merge=reject)
+    assert rejected == [(SLOT_ID, "nope")]
+    assert storage.find_slot_by_id(SLOT_ID)["content"] == "初中数学"
+
+
+def test_parallel_writes_to_different_shards(sharded_store):
+    contents = ["初中数学", "高中物理", "初中英语", "高中化学"]
+
+    def worker(n, content):
+        for i in range(20):
+            storage.upsert_slots([{
+                "slot_id": f"P{n}_{i}", "time": "2026-03-01 10:00", "teacher": "李老师",
+                "content": content, "capacity": 5, "booked": 0, "location": "",
+            }])
+
+    threads = [threading.Thread(target=worker, args=(n, c)) for n, c in enumerate(contents)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    for n, content in enumerate(contents):
+        ids = {s["slot_id"] for s in storage.get_slots(content)}
+        assert {f"P{n}_{i}" for i in range(20)} <= ids
+
+
+def _add_slot_externally(key, slot_id):
+    """绕过 storage 直接改写分片文件（另一个进程或手工编辑）"""
+    path = storage._shard_path(key)
+    data = _read(path)
+    data["slots"].append({**data["slots"][0], "slot_id": slot_id})
+    storage._write_json(path, data)
+
+
+def test_router_picks_up_external_edits(sharded_store):
+    assert storage.find_slot_by_id(SLOT_ID) is not None
+    _add_slot_externally("高中物理", "EXTERNAL")
+    assert storage.find_slot_by_id("EXTERNAL")["content"] == "高中物理"
+
+    # 手工把档期挪到另一个分片
+    source, target = storage._shard_path("初中数学"), storage._shard_path("高中物理")
+    src, dst = _read(source), _read(target)
+    slot = next(s for s in src["slots"] if s["slot_id"] == SLOT_ID)
+    src["slots"].remove(slot)
+    dst["slots"].append(slot)
+    storage._write_json(source, src)
+    storage._write_json(target, dst)
+    assert storage._ROUTER.locate([SLOT_ID]) == {SLOT_ID: "高中物理"}
+
+
+def test_router_does_not_miss_write_racing_with_refresh(sharded_store, monkeypatch):
+    storage.check_layout()
+    read = storage._read_shard_file
+    raced = []
+
+    def read_then_write(key):
+        data = read(key)
+        if key == "高中物理" and not raced:
+            # 读取完成、记录签名之前，另一个写入者改写了该分片
+            raced.append(key)
+            _add_slot_externally(key, "RACED")
+        return data
+
+    monkeypatch.setattr(storage, "_read_shard_file", read_then_write)
+    assert storage._ROUTER.locate(["RACED"]) == {}
+    assert raced
+    assert storage._ROUTER.locate(["RACED"]) == {"RACED": "高中物理"}
+
+
+DUPLICATE_ROWS = [
+    # 合法插入后紧跟一条 booked 超出容量的更新：只拒绝第二条
+    "D1,2026-03-01 10:00,t,初中数学,5,0,",
+    "D1,,,,,9,",
+    # 多条依次生效，最终换课程（换分片）
+    "D2,2026-03-02 10:00,t,初中数学,5,1,",
+    "D2,,,,6,,",
+    "D2,,,高中物理,,2,",
+    # 已有档期：非法行夹在两条合法更新之间
+    f"{SLOT_ID},,,,9,,",
+    f"{SLOT_ID},,,,,99,",
+    f"{SLOT_ID},,,,,6,实验楼 B-2",
+    # 新档期的首条缺少必填字段被拒绝，后一条完整记录正常插入
+    "D3,,,初中数学,5,0,",
+    "D3,2026-03-03 10:00,t,初中数学,5,0,",
+]
+
+
+def _import_duplicates():
+    text = "slot_id,time,teacher,content,capacity,booked,location\n" + "\n".join(DUPLICATE_ROWS) + "\n"
+    done = list(bulk_io.import_records(io.StringIO(text), "slots", "csv"))[-1]
+    counts = {k: done[k] for k in ("inserted", "updated", "invalid")}
+    errors = sorted((e["line"], e["error"]) for e in done["errors"])
+    return counts, errors, _snapshot()
+
+
+@pytest.mark.parametrize("mode", ["content", "campus"])
+def test_duplicate_rows_in_one_chunk_match_single_file_mode(store, monkeypatch, mode):
+    shutil.copy(store / "db.json", store / "pristine.json")
+    expected = _import_duplicates()
+    assert expected[0] == {"inserted": 3, "updated": 4, "invalid": 3}
+
+    # 换一份干净的存储，按分片模式重跑同样的输入
+    shutil.copy(store / "pristine.json", store / "db.json")
+    monkeypatch.setattr(storage, "_ROUTER", storage._SlotRouter())
+    _reset(monkeypatch, mode)
+    assert _import_duplicates() == expected
+
+
+def _held_by_other(path):
+    """另开一个文件描述尝试加锁，失败说明锁被持有（flock 按打开的文件描述互斥，等同另一个进程）"""
+    fcntl = pytest.importorskip("fcntl")
+    fd = os.open(path, os.O_RDWR | os.O_CREAT)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    finally:
+        os.close(fd)
+    return False
+
+
+def test_relayout_holds_bulk_and_all_shard_locks(baseline, monkeypatch, store):
+    _reset(monkeypatch, "content")
+    storage.check_layout()
+    old_keys = storage._list_shard_keys()
+    held = {}
+    write_layout = storage._write_layout
+
+    def probe(mode):
+        held["bulk"] = _held_by_other(store / "bulk.lock")
+        held["db"] = _held_by_other(storage._lock_path(storage.MAIN_SHARD))
+        held["old"] = all(_held_by_other(storage._lock_path(k)) for k in old_keys)
+        held["new"] = all(_held_by_other(storage._lock_path(k)) for k in storage._list_shard_keys())
+        write_layout(mode)
+
+    monkeypatch.setattr(storage, "_write_layout", probe)
+    _reset(monkeypatch, "campus")
+    storage.migrate()
+    assert held == {"bulk": True, "db": True, "old": True, "new": True}
+    assert _snapshot() == baseline
+
+
+def test_resume_waits_for_running_bulk_import(baseline, monkeypatch, store):
+    _reset(monkeypatch, "content")
+    storage.check_layout()
+    loaded, release = threading.Event(), threading.Event()
+
+    def importer():
+        with storage.bulk_session():
+            storage.upsert_slots([{**baseline[0][0], "slot_id": "BULK_NEW"}])
+            loaded.set()
+            release.wait(5)
+
+    t = threading.Thread(target=importer, daemon=True)
+    t.start()
+    assert loaded.wait(5)
+
+    # 模拟上次迁移中断（db.json 仍有档期），重新启动时会自动继续迁移
+    db = _read(store / "db.json")
+    db["slots"] = baseline[0][:3]
+    storage._write_json(store / "db.json", db)
+    monkeypatch.setattr(storage, "_LAYOUT_CHECKED", False)
+    m = threading.Thread(target=storage.check_layout, daemon=True)
+    m.start()
+    m.join(0.3)
+    assert m.is_alive()
+
+    release.set()
+    t.join(5)
+    m.join(5)
+    assert not m.is_alive()
+    assert storage.find_slot_by_id("BULK_NEW") is not None
+    assert "slots" not in _read(store / "db.json")
+    assert len(storage.get_slots()) == len(baseline[0]) + 1